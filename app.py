@@ -2,6 +2,9 @@ import os
 
 from aws_cdk import core
 
+from aws.batch_stack import BatchStack
+from aws.cache_stack import CacheStack
+from aws.cdn_stack import CdnStack
 from aws.db_stack import DBStack
 from aws.foundation_stack import FoundationStack
 from aws.s3_stack import S3Stack
@@ -55,6 +58,16 @@ db_stack = DBStack(
     vpc=foundation_stack.vpc,
 )
 
+cache_stack = CacheStack(
+    app,
+    id_gen(deploy_env, comm_props, "cache"),
+    env=env,
+    deploy_env=deploy_env,
+    comm_props=comm_props,
+    env_props=env_props,
+    vpc=foundation_stack.vpc,
+)
+
 eks_managed_stack = EksManagedStack(
     app,
     id_gen(deploy_env, comm_props, "eks-service"),
@@ -67,4 +80,27 @@ eks_managed_stack = EksManagedStack(
     elb_sg=foundation_stack.elb_sg,
 )
 
+batch_stack = BatchStack(
+    app,
+    id_gen(deploy_env, comm_props, "batch"),
+    env=env,
+    deploy_env=deploy_env,
+    comm_props=comm_props,
+    env_props=env_props,
+    vpc=foundation_stack.vpc,
+    backend_repo=foundation_stack.backend_repo,
+    data_bucket=s3_stack.data_bucket,
+)
+
+if env_props.cdn is not None:
+    cdn_stack = CdnStack(
+        app,
+        id_gen(deploy_env, comm_props, "cdn"),
+        env=env,
+        deploy_env=deploy_env,
+        comm_props=comm_props,
+        env_props=env_props,
+        cdn_conf=env_props.cdn,
+    )
+
 app.synth()
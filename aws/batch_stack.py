@@ -0,0 +1,264 @@
+from aws_cdk import aws_batch as batch
+from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_ecr as ecr
+from aws_cdk import aws_ecs as ecs
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda as lambda_
+from aws_cdk import aws_s3 as s3
+from aws_cdk import aws_ssm as ssm
+from aws_cdk import aws_stepfunctions as sfn
+from aws_cdk import aws_stepfunctions_tasks as sfn_tasks
+from aws_cdk import core
+
+from helpers.prop_loader import CommonProperties, EnvDepProperties
+from helpers.utils import id_gen
+
+# S3 prefix of the data of the match requests, batch/<request_id>/...
+BATCH_DATA_PREFIX = "batch"
+
+# returns the shard keys the split job wrote to batch/<request_id>/shards.json
+SHARD_MANIFEST_READER_CODE = """
+import json
+
+import boto3
+
+s3 = boto3.client("s3")
+
+
+def handler(event, context):
+    key = f"{event['prefix']}/{event['request_id']}/shards.json"
+    body = s3.get_object(Bucket=event["bucket"], Key=key)["Body"].read()
+    return json.loads(body)["shards"]
+"""
+
+
+class BatchStack(core.Stack):
+    def __init__(
+        self,
+        app: core.App,
+        id: str,
+        env: core.Environment,
+        deploy_env: str,
+        comm_props: CommonProperties,
+        env_props: EnvDepProperties,
+        vpc: ec2.Vpc,
+        backend_repo: ecr.IRepository,
+        data_bucket: s3.IBucket,
+    ) -> None:
+        """
+        BatchStack runs the match requests too large for the EKS node groups:
+        - spot compute environment in the private subnets
+        - a job queue per priority
+        - job definition of the backend image
+        - a state machine per job queue, which splits a match request into
+          shards, matches the shards in parallel and merges the results
+          into the data bucket
+        """
+
+        super().__init__(app, id, env=env)
+
+        batch_conf = env_props.batch
+
+        """ Compute environment and job queues """
+        compute_env = batch.ComputeEnvironment(
+            self,
+            "batch-spot-compute-env",
+            compute_environment_name=id_gen(
+                deploy_env, comm_props, "batch-spot"
+            ),
+            compute_resources=batch.ComputeResources(
+                vpc=vpc,
+                vpc_subnets=ec2.SubnetSelection(
+                    subnet_type=ec2.SubnetType.PRIVATE
+                ),
+                type=batch.ComputeResourceType.SPOT,
+                allocation_strategy=batch.AllocationStrategy.SPOT_CAPACITY_OPTIMIZED,
+                instance_types=[
+                    ec2.InstanceType(instance_type)
+                    for instance_type in batch_conf.instance_types
+                ],
+                minv_cpus=batch_conf.min_vcpus,
+                maxv_cpus=batch_conf.max_vcpus,
+                compute_resources_tags={
+                    "Name": id_gen(deploy_env, comm_props, "batch-spot")
+                },
+            ),
+        )
+
+        job_queues = {
+            queue_name: batch.JobQueue(
+                self,
+                f"batch-job-queue-{queue_name}",
+                job_queue_name=id_gen(
+                    deploy_env, comm_props, f"batch-{queue_name}"
+                ),
+                priority=priority,
+                compute_environments=[
+                    batch.JobQueueComputeEnvironment(
+                        compute_environment=compute_env, order=1
+                    )
+                ],
+            )
+            for queue_name, priority in batch_conf.queues.items()
+        }
+
+        """ Job definition """
+        job_role = iam.Role(
+            self,
+            "iam-batch-job-role",
+            assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
+            role_name=id_gen(deploy_env, comm_props, "batch-job-role"),
+            description="This role is used by the match jobs on AWS Batch",
+        )
+        data_bucket.grant_read_write(job_role, f"{BATCH_DATA_PREFIX}/*")
+        job_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "secretsmanager:GetSecretValue",
+                ],
+                effect=iam.Effect.ALLOW,
+                resources=[
+                    f"arn:aws:secretsmanager:{env.region}:{env.account}:secret:{comm_props.product_prefix}-{deploy_env}-*"
+                ],
+            )
+        )
+
+        job_definition = batch.JobDefinition(
+            self,
+            "batch-match-job-def",
+            job_definition_name=id_gen(deploy_env, comm_props, "batch-match"),
+            container=batch.JobDefinitionContainer(
+                image=ecs.ContainerImage.from_ecr_repository(
+                    backend_repo, tag=batch_conf.image_tag
+                ),
+                vcpus=batch_conf.job.vcpus,
+                memory_limit_mib=batch_conf.job.memory_mib,
+                job_role=job_role,
+                environment={
+                    "AWS_DEFAULT_REGION": core.Aws.REGION,
+                    "API_RUN_LOCATION": "batch",
+                    "DATA_BUCKET": data_bucket.bucket_name,
+                    "MATCH_DATA_PREFIX": BATCH_DATA_PREFIX,
+                },
+            ),
+            retry_attempts=batch_conf.job.retry_attempts,
+            timeout=core.Duration.minutes(batch_conf.job.timeout_minutes),
+        )
+
+        """ Step Functions pipeline """
+        shard_manifest_reader = lambda_.Function(
+            self,
+            "batch-shard-manifest-reader",
+            function_name=id_gen(
+                deploy_env, comm_props, "batch-shard-manifest-reader"
+            ),
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            handler="index.handler",
+            code=lambda_.Code.from_inline(SHARD_MANIFEST_READER_CODE),
+            timeout=core.Duration.seconds(30),
+        )
+        data_bucket.grant_read(
+            shard_manifest_reader, f"{BATCH_DATA_PREFIX}/*/shards.json"
+        )
+
+        for queue_name, job_queue in job_queues.items():
+            state_machine = self._create_match_state_machine(
+                deploy_env,
+                comm_props,
+                env_props,
+                queue_name,
+                job_queue,
+                job_definition,
+                shard_manifest_reader,
+                data_bucket,
+            )
+            ssm.StringParameter(
+                self,
+                f"ssm-batch-match-state-machine-{queue_name}-arn",
+                parameter_name=id_gen(
+                    deploy_env,
+                    comm_props,
+                    f"ssm-batch-match-state-machine-{queue_name}-arn",
+                ),  # the backend starts the executions with it
+                string_value=state_machine.state_machine_arn,
+            )
+
+    def _create_match_state_machine(
+        self,
+        deploy_env: str,
+        comm_props: CommonProperties,
+        env_props: EnvDepProperties,
+        queue_name: str,
+        job_queue: batch.JobQueue,
+        job_definition: batch.JobDefinition,
+        shard_manifest_reader: lambda_.Function,
+        data_bucket: s3.IBucket,
+    ) -> sfn.StateMachine:
+        """
+        Input of an execution: {"request_id": "..."}, with the data of the
+        request in batch/<request_id>/ of the data bucket.
+        """
+
+        def match_job(step: str, environment: dict) -> sfn_tasks.BatchSubmitJob:
+            return sfn_tasks.BatchSubmitJob(
+                self,
+                f"batch-match-{queue_name}-{step}",
+                job_name=f"match-{step}",
+                job_queue_arn=job_queue.job_queue_arn,
+                job_definition_arn=job_definition.job_definition_arn,
+                container_overrides=sfn_tasks.BatchContainerOverrides(
+                    command=[f"start-match-{step}"],
+                    environment={
+                        "MATCH_REQUEST_ID": sfn.JsonPath.string_at(
+                            "$.request_id"
+                        ),
+                        **environment,
+                    },
+                ),
+                result_path=sfn.JsonPath.DISCARD,
+            )
+
+        # writes the shards and batch/<request_id>/shards.json
+        split = match_job("split", {})
+        read_shards = sfn_tasks.LambdaInvoke(
+            self,
+            f"batch-match-{queue_name}-read-shards",
+            lambda_function=shard_manifest_reader,
+            payload=sfn.TaskInput.from_object(
+                {
+                    "bucket": data_bucket.bucket_name,
+                    "prefix": BATCH_DATA_PREFIX,
+                    "request_id": sfn.JsonPath.string_at("$.request_id"),
+                }
+            ),
+            payload_response_only=True,
+            result_path="$.shards",
+        )
+        match_shards = sfn.Map(
+            self,
+            f"batch-match-{queue_name}-shards",
+            items_path="$.shards",
+            max_concurrency=env_props.batch.shard_max_concurrency,
+            parameters={
+                "request_id.$": "$.request_id",
+                "shard_key.$": "$$.Map.Item.Value",
+            },
+            result_path=sfn.JsonPath.DISCARD,
+        )
+        match_shards.iterator(
+            match_job(
+                "shard",
+                {"MATCH_SHARD_KEY": sfn.JsonPath.string_at("$.shard_key")},
+            )
+        )
+        # merges the shard results into batch/<request_id>/result
+        merge = match_job("merge", {})
+
+        return sfn.StateMachine(
+            self,
+            f"batch-match-state-machine-{queue_name}",
+            state_machine_name=id_gen(
+                deploy_env, comm_props, f"batch-match-{queue_name}"
+            ),
+            definition=split.next(read_shards).next(match_shards).next(merge),
+        )
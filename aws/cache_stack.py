@@ -0,0 +1,160 @@
+from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_elasticache as elasticache
+from aws_cdk import aws_ssm as ssm
+from aws_cdk import core
+
+from helpers.prop_loader import CacheTierCfg, CommonProperties, EnvDepProperties
+from helpers.utils import id_gen
+
+# parameter group of the redis tiers, parameters of the tier in env_props
+# overrides them
+CACHE_BASE_PARAMETERS = {
+    # queue tiers hold rq jobs, which must never be evicted. The cache tier
+    # overrides it with an LRU policy
+    "maxmemory-policy": "noeviction",
+    # closes client connections idle for longer, in seconds
+    "timeout": "300",
+    "tcp-keepalive": "60",
+}
+
+REDIS_PORT = 6379
+
+
+class CacheStack(core.Stack):
+    def __init__(
+        self,
+        app: core.App,
+        id: str,
+        env: core.Environment,
+        deploy_env: str,
+        comm_props: CommonProperties,
+        env_props: EnvDepProperties,
+        vpc: ec2.Vpc,
+    ) -> None:
+        """
+        CacheStack init the Redis tiers of the job queues and the app cache,
+        replacing the bitnami Redis in the EKS cluster:
+        - an ElastiCache replication group per tier in the isolated subnets,
+          with the password of the redis-secret as auth token (TLS only)
+        - a parameter group per tier, for its eviction policy and timeouts
+        - parameter stores of the primary and reader endpoints of each tier
+        """
+
+        super().__init__(app, id, env=env)
+
+        subnet_group = elasticache.CfnSubnetGroup(
+            self,
+            "redis-subnet-group",
+            cache_subnet_group_name=id_gen(deploy_env, comm_props, "redis"),
+            description="isolated subnets of the redis replication groups",
+            subnet_ids=vpc.select_subnets(
+                subnet_type=ec2.SubnetType.ISOLATED
+            ).subnet_ids,
+        )
+
+        redis_sg = ec2.SecurityGroup(
+            self,
+            "redis-sg",
+            vpc=vpc,
+            allow_all_outbound=False,
+            description="SG for the redis replication groups",
+        )
+        # only open 6379 for internal traffic
+        redis_sg.add_ingress_rule(
+            peer=ec2.Peer.ipv4(comm_props.vpc_default_cidr),
+            connection=ec2.Port.tcp(REDIS_PORT),
+        )
+
+        for tier, tier_conf in env_props.cache.tiers.items():
+            self._add_redis_tier(
+                deploy_env, comm_props, tier, tier_conf, subnet_group, redis_sg
+            )
+
+    def _add_redis_tier(
+        self,
+        deploy_env: str,
+        comm_props: CommonProperties,
+        tier: str,
+        tier_conf: CacheTierCfg,
+        subnet_group: elasticache.CfnSubnetGroup,
+        redis_sg: ec2.SecurityGroup,
+    ) -> None:
+        tier_name = id_gen(deploy_env, comm_props, f"redis-{tier}")
+
+        parameters = {**CACHE_BASE_PARAMETERS, **tier_conf.parameters}
+        if tier_conf.cluster_mode:
+            parameters["cluster-enabled"] = "yes"
+        parameter_group = elasticache.CfnParameterGroup(
+            self,
+            f"redis-{tier}-parameter-group",
+            cache_parameter_group_family=tier_conf.parameter_group_family,
+            description=f"{tier_name} parameters",
+            properties=parameters,
+        )
+
+        high_availability = tier_conf.replicas > 0
+        replication_group = elasticache.CfnReplicationGroup(
+            self,
+            f"redis-{tier}",
+            replication_group_id=tier_name,
+            replication_group_description=f"redis {tier} tier of uniframe",
+            engine="redis",
+            engine_version=tier_conf.engine_version,
+            cache_node_type=tier_conf.node_type,
+            cache_parameter_group_name=parameter_group.ref,
+            cache_subnet_group_name=subnet_group.ref,
+            security_group_ids=[redis_sg.security_group_id],
+            port=REDIS_PORT,
+            automatic_failover_enabled=high_availability,
+            multi_az_enabled=high_availability,
+            # ElastiCache has no AOF, daily snapshots are the persistence
+            snapshot_retention_limit=tier_conf.snapshot_retention_days,
+            snapshot_window=(
+                tier_conf.snapshot_window
+                if tier_conf.snapshot_retention_days
+                else None
+            ),
+            at_rest_encryption_enabled=True,
+            # an auth token needs transit encryption
+            transit_encryption_enabled=True,
+            auth_token=core.SecretValue.secrets_manager(
+                id_gen(deploy_env, comm_props, "redis-secret")
+            ).to_string(),
+            auto_minor_version_upgrade=True,
+            # shards of one primary and the replicas in cluster mode, a single
+            # primary and the replicas otherwise
+            num_node_groups=(
+                tier_conf.num_shards if tier_conf.cluster_mode else None
+            ),
+            replicas_per_node_group=(
+                tier_conf.replicas if tier_conf.cluster_mode else None
+            ),
+            num_cache_clusters=(
+                None if tier_conf.cluster_mode else 1 + tier_conf.replicas
+            ),
+        )
+
+        """ Parameter stores for the Redis tier """
+        if tier_conf.cluster_mode:
+            # cluster clients discover primaries and replicas from it
+            primary_endpoint = replication_group.attr_configuration_end_point_address
+            reader_endpoint = primary_endpoint
+        else:
+            primary_endpoint = replication_group.attr_primary_end_point_address
+            reader_endpoint = replication_group.attr_reader_end_point_address
+        ssm.StringParameter(
+            self,
+            f"ssm-redis-{tier}-primary-endpoint",
+            parameter_name=id_gen(
+                deploy_env, comm_props, f"ssm-redis-{tier}-primary-endpoint"
+            ),  # hardcode the name because Github action will use it
+            string_value=primary_endpoint,
+        )
+        ssm.StringParameter(
+            self,
+            f"ssm-redis-{tier}-reader-endpoint",
+            parameter_name=id_gen(
+                deploy_env, comm_props, f"ssm-redis-{tier}-reader-endpoint"
+            ),  # hardcode the name because Github action will use it
+            string_value=reader_endpoint,
+        )
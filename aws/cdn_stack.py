@@ -0,0 +1,194 @@
+from typing import cast
+
+from aws_cdk import aws_certificatemanager as acm
+from aws_cdk import aws_cloudfront as cloudfront
+from aws_cdk import aws_cloudfront_origins as origins
+from aws_cdk import aws_route53 as route53
+from aws_cdk import aws_route53_targets as route53_targets
+from aws_cdk import aws_ssm as ssm
+from aws_cdk import core
+
+from helpers.prop_loader import (
+    CdnCfg,
+    CdnSiteCfg,
+    CommonProperties,
+    EnvDepProperties,
+)
+from helpers.utils import id_gen
+
+
+class CdnStack(core.Stack):
+    def __init__(
+        self,
+        app: core.App,
+        id: str,
+        env: core.Environment,
+        deploy_env: str,
+        comm_props: CommonProperties,
+        env_props: EnvDepProperties,
+        cdn_conf: CdnCfg,
+    ) -> None:
+        """
+        CdnStack puts CloudFront in front of the static sites (frontend, doc):
+        - a certificate in us-east-1 for the hostnames of the sites, the one of
+          CloudFront can't be the eu-west-1 certificate of the ingresses
+        - a distribution per site, with the ingress at origin-<prefix>.<domain>
+          as origin, long cache of the static paths and short cache of the rest
+        - alias records of <prefix>.<domain> to the distributions
+
+        external-dns owns the records of the ingresses, so the uniframe chart
+        must move them to origin-<prefix>.<domain> (helm-install-uniframe.sh)
+        before the first deployment of this stack.
+        """
+
+        super().__init__(app, id, env=env)
+
+        domain_name = env_props.eks_host_zone.domain_name
+
+        hosted_zone = route53.HostedZone.from_hosted_zone_attributes(
+            self,
+            "eks_hosted_zone",
+            hosted_zone_id=env_props.eks_host_zone.id,
+            zone_name=domain_name,
+        )
+
+        site_domain_names = [
+            f"{site_conf.hostname_prefix}.{domain_name}"
+            for site_conf in cdn_conf.sites.values()
+        ]
+        certificate = acm.DnsValidatedCertificate(
+            self,
+            "cdn-certificate",
+            hosted_zone=hosted_zone,
+            domain_name=site_domain_names[0],
+            subject_alternative_names=site_domain_names[1:],
+            # CloudFront only takes certificates of us-east-1
+            region="us-east-1",
+        )
+
+        for site, site_conf in cdn_conf.sites.items():
+            distribution = self._create_distribution(
+                deploy_env,
+                comm_props,
+                env_props,
+                cdn_conf,
+                site,
+                site_conf,
+                certificate,
+            )
+
+            """ Alias records of the site """
+            record_target = route53.RecordTarget.from_alias(
+                route53_targets.CloudFrontTarget(distribution)
+            )
+            route53.ARecord(
+                self,
+                f"cdn-{site}-a-record",
+                zone=hosted_zone,
+                record_name=site_conf.hostname_prefix,
+                target=record_target,
+            )
+            route53.AaaaRecord(
+                self,
+                f"cdn-{site}-aaaa-record",
+                zone=hosted_zone,
+                record_name=site_conf.hostname_prefix,
+                target=record_target,
+            )
+
+            ssm.StringParameter(
+                self,
+                f"ssm-cdn-{site}-distribution-id",
+                parameter_name=id_gen(
+                    deploy_env, comm_props, f"ssm-cdn-{site}-distribution-id"
+                ),  # hardcode the name because Github action will use it
+                string_value=distribution.distribution_id,
+            )
+
+    def _create_distribution(
+        self,
+        deploy_env: str,
+        comm_props: CommonProperties,
+        env_props: EnvDepProperties,
+        cdn_conf: CdnCfg,
+        site: str,
+        site_conf: CdnSiteCfg,
+        certificate: acm.ICertificate,
+    ) -> cloudfront.Distribution:
+        domain_name = env_props.eks_host_zone.domain_name
+
+        # the wildcard certificate of the ALB covers the origin hostname.
+        # The Host header isn't forwarded, the ingress has a rule of the
+        # origin hostname
+        origin = origins.HttpOrigin(
+            f"{site_conf.origin_hostname_prefix}.{domain_name}",
+            protocol_policy=cloudfront.OriginProtocolPolicy.HTTPS_ONLY,
+            origin_ssl_protocols=[cloudfront.OriginSslPolicy.TLS_V1_2],
+            origin_shield_region=cdn_conf.origin_shield_region,
+        )
+
+        # the cache key only holds the path, and the query string of the pages
+        static_cache_policy = cloudfront.CachePolicy(
+            self,
+            f"cdn-{site}-static-cache-policy",
+            cache_policy_name=id_gen(deploy_env, comm_props, f"cdn-{site}-static"),
+            comment=f"static assets of {site}",
+            min_ttl=core.Duration.days(1),
+            default_ttl=core.Duration.days(site_conf.static_ttl_days),
+            max_ttl=core.Duration.days(site_conf.static_ttl_days),
+            query_string_behavior=cloudfront.CacheQueryStringBehavior.none(),
+            header_behavior=cloudfront.CacheHeaderBehavior.none(),
+            cookie_behavior=cloudfront.CacheCookieBehavior.none(),
+            enable_accept_encoding_gzip=True,
+            enable_accept_encoding_brotli=True,
+        )
+        page_cache_policy = cloudfront.CachePolicy(
+            self,
+            f"cdn-{site}-page-cache-policy",
+            cache_policy_name=id_gen(deploy_env, comm_props, f"cdn-{site}-page"),
+            comment=f"pages of {site}",
+            min_ttl=core.Duration.seconds(0),
+            default_ttl=core.Duration.seconds(site_conf.default_ttl_seconds),
+            max_ttl=core.Duration.seconds(site_conf.max_ttl_seconds),
+            query_string_behavior=cloudfront.CacheQueryStringBehavior.all(),
+            header_behavior=cloudfront.CacheHeaderBehavior.none(),
+            cookie_behavior=cloudfront.CacheCookieBehavior.none(),
+            enable_accept_encoding_gzip=True,
+            enable_accept_encoding_brotli=True,
+        )
+
+        def behavior(cache_policy: cloudfront.ICachePolicy) -> cloudfront.BehaviorOptions:
+            return cloudfront.BehaviorOptions(
+                origin=origin,
+                cache_policy=cache_policy,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD_OPTIONS,
+                cached_methods=cloudfront.CachedMethods.CACHE_GET_HEAD_OPTIONS,
+                compress=True,
+            )
+
+        distribution = cloudfront.Distribution(
+            self,
+            f"cdn-{site}-distribution",
+            comment=id_gen(deploy_env, comm_props, f"cdn-{site}"),
+            default_behavior=behavior(page_cache_policy),
+            additional_behaviors={
+                path: behavior(static_cache_policy)
+                for path in site_conf.static_paths
+            },
+            certificate=certificate,
+            domain_names=[f"{site_conf.hostname_prefix}.{domain_name}"],
+            minimum_protocol_version=cloudfront.SecurityPolicyProtocol.TLS_V1_2_2021,
+            http_version=cloudfront.HttpVersion.HTTP2,
+            price_class=cloudfront.PriceClass[cdn_conf.price_class],
+            enable_ipv6=True,
+        )
+        if cdn_conf.http3:
+            # HttpVersion of CDK 1.x has no http2and3
+            cast(
+                cloudfront.CfnDistribution, distribution.node.default_child
+            ).add_property_override(
+                "DistributionConfig.HttpVersion", "http2and3"
+            )
+
+        return distribution
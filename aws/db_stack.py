@@ -1,13 +1,43 @@
+from typing import cast
+
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_logs as logs
 from aws_cdk import aws_rds as rds
+from aws_cdk import aws_route53 as route53
 from aws_cdk import aws_secretsmanager as sm
 from aws_cdk import aws_ssm as ssm
 from aws_cdk import core
 
-from helpers.prop_loader import CommonProperties, EnvDepProperties
+from helpers.prop_loader import CommonProperties, DbCfg, EnvDepProperties
 from helpers.utils import id_gen
 
+# parameter group of api-pg, db.parameters of env_props overrides them.
+# Memory parameters are in units of 8 kB (shared_buffers, effective_cache_size)
+# or kB (work_mem, maintenance_work_mem)
+DB_BASE_PARAMETERS = {
+    # query statistics of the matching queries
+    "shared_preload_libraries": "pg_stat_statements",
+    "pg_stat_statements.track": "all",
+    "track_io_timing": "1",
+    # memory
+    "shared_buffers": "{DBInstanceClassMemory/32768}",
+    "effective_cache_size": "{DBInstanceClassMemory/16384}",
+    "work_mem": "8192",
+    "maintenance_work_mem": "131072",
+    # planner, gp2/gp3 storage is SSD
+    "random_page_cost": "1.1",
+    "effective_io_concurrency": "200",
+    # autovacuum, the match result tables get many updates
+    "autovacuum_vacuum_scale_factor": "0.05",
+    "autovacuum_analyze_scale_factor": "0.02",
+    "autovacuum_vacuum_cost_limit": "1000",
+    # logging
+    "log_min_duration_statement": "1000",
+    "log_autovacuum_min_duration": "1000",
+    "log_lock_waits": "1",
+    "log_temp_files": "10240",
+}
+
 
 class DBStack(core.Stack):
     def __init__(
@@ -47,33 +77,70 @@ class DBStack(core.Stack):
 
         DB_NAME = "nm"
 
+        db_conf = env_props.db
+        # gp3 is missing in rds.StorageType of this CDK version, it is set
+        # by the escape hatch below
+        storage_type = {
+            "gp2": rds.StorageType.GP2,
+            "gp3": rds.StorageType.GP2,
+            "io1": rds.StorageType.IO1,
+        }[db_conf.storage_type]
+
+        engine = rds.DatabaseInstanceEngine.postgres(
+            version=rds.PostgresEngineVersion.of(
+                db_conf.engine_version, db_conf.engine_major_version
+            )
+        )
+        parameter_group = rds.ParameterGroup(
+            self,
+            "api-pg-parameter-group",
+            engine=engine,
+            description=f"{id_gen(deploy_env, comm_props, 'api-pg')} parameters",
+            parameters={**DB_BASE_PARAMETERS, **db_conf.parameters},
+        )
+        monitoring_interval = (
+            core.Duration.seconds(db_conf.monitoring_interval_seconds)
+            if db_conf.monitoring_interval_seconds
+            else None
+        )
+        performance_insight_retention = (
+            rds.PerformanceInsightRetention[
+                db_conf.performance_insights_retention
+            ]
+            if db_conf.performance_insights
+            else None
+        )
+
         api_db = rds.DatabaseInstance(
             self,
             "api-pg",
             instance_identifier=id_gen(deploy_env, comm_props, "api-pg"),
-            engine=rds.DatabaseInstanceEngine.postgres(
-                version=rds.PostgresEngineVersion.VER_12_2
-            ),
+            engine=engine,
+            parameter_group=parameter_group,
             database_name=DB_NAME,
-            instance_type=ec2.InstanceType.of(
-                ec2.InstanceClass.BURSTABLE2, ec2.InstanceSize.MICRO
-            ),
+            instance_type=ec2.InstanceType(db_conf.instance_type),
             credentials=rds.Credentials.from_secret(secret),
             vpc=vpc,
             vpc_subnets=ec2.SubnetSelection(
                 subnet_type=ec2.SubnetType.ISOLATED
             ),
             auto_minor_version_upgrade=False,
-            multi_az=False,
-            allocated_storage=10,
-            storage_type=rds.StorageType.GP2,
+            multi_az=db_conf.multi_az,
+            allocated_storage=db_conf.allocated_storage_gb,
+            max_allocated_storage=db_conf.max_allocated_storage_gb,
+            storage_type=storage_type,
+            iops=db_conf.iops if db_conf.storage_type == "io1" else None,
             cloudwatch_logs_exports=["postgresql"],
             cloudwatch_logs_retention=logs.RetentionDays.ONE_WEEK,
+            enable_performance_insights=db_conf.performance_insights,
+            performance_insight_retention=performance_insight_retention,
+            monitoring_interval=monitoring_interval,
             deletion_protection=False,
             delete_automated_backups=False,
             backup_retention=core.Duration.days(7),
             removal_policy=core.RemovalPolicy.DESTROY,
         )
+        self._override_gp3_storage(api_db, db_conf)
         # only open 5432 for internal traffic
         api_db.connections.allow_from(
             other=ec2.Peer.ipv4(comm_props.vpc_default_cidr),
@@ -90,6 +157,122 @@ class DBStack(core.Stack):
             ),  # hardcode the name because Github action will use it
             string_value=api_db.db_instance_endpoint_address,
         )
+
+        """ RDS Proxy pooling the connections of the pods """
+        if db_conf.proxy is not None:
+            proxy_conf = db_conf.proxy
+            api_db_proxy = rds.DatabaseProxy(
+                self,
+                "api-pg-proxy",
+                db_proxy_name=id_gen(deploy_env, comm_props, "api-pg-proxy"),
+                proxy_target=rds.ProxyTarget.from_instance(api_db),
+                secrets=[secret],
+                vpc=vpc,
+                vpc_subnets=ec2.SubnetSelection(
+                    subnet_type=ec2.SubnetType.ISOLATED
+                ),
+                iam_auth=proxy_conf.iam_auth,
+                require_tls=proxy_conf.require_tls,
+                max_connections_percent=proxy_conf.max_connections_percent,
+                max_idle_connections_percent=proxy_conf.max_idle_connections_percent,
+                idle_client_timeout=core.Duration.minutes(
+                    proxy_conf.idle_client_timeout_minutes
+                ),
+                borrow_timeout=core.Duration.seconds(
+                    proxy_conf.connection_borrow_timeout_seconds
+                ),
+            )
+            api_db_proxy.connections.allow_from(
+                other=ec2.Peer.ipv4(comm_props.vpc_default_cidr),
+                port_range=ec2.Port.tcp(5432),
+            )
+            ssm.StringParameter(
+                self,
+                "ssm-api-db-proxy-dns",
+                parameter_name=id_gen(
+                    deploy_env, comm_props, "ssm-api-db-proxy-dns"
+                ),  # the pods connect to the writer through it
+                string_value=api_db_proxy.endpoint,
+            )
+
+        """ Read replicas behind the reader endpoint """
+        read_replicas = []
+        for i, replica_conf in enumerate(db_conf.read_replicas):
+            read_replica = rds.DatabaseInstanceReadReplica(
+                self,
+                f"api-pg-replica-{i}",
+                instance_identifier=id_gen(
+                    deploy_env, comm_props, f"api-pg-replica-{i}"
+                ),
+                source_database_instance=api_db,
+                instance_type=ec2.InstanceType(
+                    replica_conf.instance_type or db_conf.instance_type
+                ),
+                availability_zone=replica_conf.availability_zone,
+                vpc=vpc,
+                vpc_subnets=ec2.SubnetSelection(
+                    subnet_type=ec2.SubnetType.ISOLATED
+                ),
+                auto_minor_version_upgrade=False,
+                max_allocated_storage=db_conf.max_allocated_storage_gb,
+                storage_type=storage_type,
+                iops=db_conf.iops if db_conf.storage_type == "io1" else None,
+                cloudwatch_logs_exports=["postgresql"],
+                cloudwatch_logs_retention=logs.RetentionDays.ONE_WEEK,
+                enable_performance_insights=db_conf.performance_insights,
+                performance_insight_retention=performance_insight_retention,
+                monitoring_interval=monitoring_interval,
+                deletion_protection=False,
+                removal_policy=core.RemovalPolicy.DESTROY,
+            )
+            self._override_gp3_storage(read_replica, db_conf)
+            # parameter_group is missing in the read replica props of this
+            # CDK version
+            cast(
+                rds.CfnDBInstance, read_replica.node.default_child
+            ).add_property_override(
+                "DBParameterGroupName",
+                parameter_group.bind_to_instance().parameter_group_name,
+            )
+            read_replica.connections.allow_from(
+                other=ec2.Peer.ipv4(comm_props.vpc_default_cidr),
+                port_range=ec2.Port.tcp(5432),
+            )
+            read_replicas.append(read_replica)
+
+        if read_replicas:
+            # RDS for postgres has no reader endpoint, so the replicas get
+            # equal weights behind one name of a private zone
+            db_zone = route53.PrivateHostedZone(
+                self,
+                "api-db-private-zone",
+                zone_name=f"{id_gen(deploy_env, comm_props, 'db')}.internal",
+                vpc=vpc,
+            )
+            for i, read_replica in enumerate(read_replicas):
+                route53.CfnRecordSet(
+                    self,
+                    f"api-db-reader-record-{i}",
+                    hosted_zone_id=db_zone.hosted_zone_id,
+                    name=f"reader.{db_zone.zone_name}",
+                    type="CNAME",
+                    ttl="30",
+                    set_identifier=f"api-pg-replica-{i}",
+                    weight=1,
+                    resource_records=[read_replica.db_instance_endpoint_address],
+                )
+            reader_dns = f"reader.{db_zone.zone_name}"
+        else:
+            reader_dns = api_db.db_instance_endpoint_address
+
+        ssm.StringParameter(
+            self,
+            "ssm-api-db-reader-dns",
+            parameter_name=id_gen(
+                deploy_env, comm_props, "ssm-api-db-reader-dns"
+            ),  # read-only queries of the backend go to it
+            string_value=reader_dns,
+        )
         ssm.StringParameter(
             self,
             "ssm-api-db-name",
@@ -98,3 +281,17 @@ class DBStack(core.Stack):
             ),  # hardcode the name because Github action will use it
             string_value=DB_NAME,
         )
+
+    @staticmethod
+    def _override_gp3_storage(
+        db: rds.DatabaseInstanceBase, db_conf: DbCfg
+    ) -> None:
+        if db_conf.storage_type != "gp3":
+            return
+        cfn_db = cast(rds.CfnDBInstance, db.node.default_child)
+        cfn_db.add_property_override("StorageType", "gp3")
+        if db_conf.iops is not None:
+            cfn_db.add_property_override("Iops", db_conf.iops)
+            cfn_db.add_property_override(
+                "StorageThroughput", db_conf.throughput_mibps
+            )
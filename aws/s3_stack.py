@@ -1,4 +1,6 @@
 from aws_cdk import aws_s3
+from aws_cdk import aws_s3_notifications as s3n
+from aws_cdk import aws_sqs as sqs
 from aws_cdk import aws_ssm as ssm
 from aws_cdk import core
 from aws_cdk.aws_s3 import BlockPublicAccess, LifecycleRule
@@ -46,6 +48,47 @@ class S3Stack(core.Stack):
             string_value=data_bucket.bucket_name,
         )
 
+        self.data_bucket = data_bucket
+
+        """ Object created events of the data bucket into SQS """
+        data_events_conf = env_props.data_events
+        data_events_dlq = sqs.Queue(
+            self,
+            "data-events-dlq",
+            queue_name=id_gen(deploy_env, comm_props, "data-events-dlq"),
+            retention_period=Duration.days(14),
+        )
+        data_events_queue = sqs.Queue(
+            self,
+            "data-events",
+            queue_name=id_gen(deploy_env, comm_props, "data-events"),
+            visibility_timeout=Duration.seconds(
+                data_events_conf.visibility_timeout_seconds
+            ),
+            retention_period=Duration.days(data_events_conf.retention_days),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                queue=data_events_dlq,
+                max_receive_count=data_events_conf.max_receive_count,
+            ),
+        )
+        for event_filter in data_events_conf.filters:
+            data_bucket.add_event_notification(
+                aws_s3.EventType.OBJECT_CREATED,
+                s3n.SqsDestination(data_events_queue),
+                aws_s3.NotificationKeyFilter(
+                    prefix=event_filter.prefix, suffix=event_filter.suffix
+                ),
+            )
+
+        ssm.StringParameter(
+            self,
+            "ssm-sqs-data-events-queue-url",
+            parameter_name=id_gen(
+                deploy_env, comm_props, "ssm-sqs-data-events-queue-url"
+            ),  # the backend and the housekeeper consume it
+            string_value=data_events_queue.queue_url,
+        )
+
         # S3 bucket for load balancer logs
         lb_log_bucket = aws_s3.Bucket(
             self,
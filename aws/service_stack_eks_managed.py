@@ -1,14 +1,27 @@
+from aws_cdk import aws_autoscaling as autoscaling
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_eks as eks
 from aws_cdk import aws_iam as iam
+from aws_cdk import aws_logs as logs
 from aws_cdk import aws_rds as rds
 from aws_cdk import aws_ssm as ssm
 from aws_cdk import core
 from aws_cdk.core import CfnJson
 
-from helpers.prop_loader import CommonProperties, EnvDepProperties
-from helpers.utils import id_gen
+from helpers.prop_loader import (
+    CommonProperties,
+    EksLaunchTemplate,
+    EksNodeGroup,
+    EnvDepProperties,
+)
+from helpers.utils import get_ec2_arch, get_eks_max_pods, id_gen
 import json
+import os
+from typing import Dict, List, Optional
+
+EKS_KUBERNETES_VERSION = eks.KubernetesVersion.V1_21
+# removed by the node-tuning daemon set of aws-plugins once the node is tuned
+NODE_TUNING_TAINT = "node-tuning.uniframe.io/pending=true:NoSchedule"
 
 
 class EksManagedStack(core.Stack):
@@ -65,7 +78,7 @@ class EksManagedStack(core.Stack):
             ],
             # security_group=eks_sg,   it doesn't work use security group here
             default_capacity=0,
-            version=eks.KubernetesVersion.V1_21,
+            version=EKS_KUBERNETES_VERSION,
             role=eks_cluster_role,
             core_dns_compute_type=eks.CoreDnsComputeType.EC2,
             endpoint_access=eks.EndpointAccess.PUBLIC_AND_PRIVATE,
@@ -79,6 +92,39 @@ class EksManagedStack(core.Stack):
         )
         cluster.node.add_dependency(api_db)
 
+        """ VPC CNI add-on """
+        # with prefix delegation every ENI slot holds a /28 prefix instead of a
+        # single IP, so pod density is bound by CPU/memory, not by ENI IPs
+        vpc_cni_conf = env_props.eks_cluster_cfg.vpc_cni
+        vpc_cni_env = {
+            "ENABLE_PREFIX_DELEGATION": str(
+                vpc_cni_conf.prefix_delegation
+            ).lower(),
+        }
+        if vpc_cni_conf.warm_prefix_target is not None:
+            vpc_cni_env["WARM_PREFIX_TARGET"] = str(
+                vpc_cni_conf.warm_prefix_target
+            )
+        if vpc_cni_conf.warm_ip_target is not None:
+            vpc_cni_env["WARM_IP_TARGET"] = str(vpc_cni_conf.warm_ip_target)
+        if vpc_cni_conf.minimum_ip_target is not None:
+            vpc_cni_env["MINIMUM_IP_TARGET"] = str(
+                vpc_cni_conf.minimum_ip_target
+            )
+
+        vpc_cni_addon = eks.CfnAddon(
+            self,
+            "eks-addon-vpc-cni",
+            addon_name="vpc-cni",
+            cluster_name=cluster.cluster_name,
+            addon_version=vpc_cni_conf.addon_version,
+            resolve_conflicts="OVERWRITE",
+        )
+        # ConfigurationValues is newer than the CfnAddon of this CDK version
+        vpc_cni_addon.add_property_override(
+            "ConfigurationValues", json.dumps({"env": vpc_cni_env})
+        )
+
         ssm.StringParameter(
             self,
             "ssm-eks-cluster-name",
@@ -170,6 +216,23 @@ class EksManagedStack(core.Stack):
             )
         )
 
+        # consume the object created events of the data bucket, see S3Stack
+        eks_node_group_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "sqs:ReceiveMessage",
+                    "sqs:DeleteMessage",
+                    "sqs:ChangeMessageVisibility",
+                    "sqs:GetQueueAttributes",
+                    "sqs:GetQueueUrl",
+                ],
+                effect=iam.Effect.ALLOW,
+                resources=[
+                    f"arn:aws:sqs:{env.region}:{env.account}:{id_gen(deploy_env, comm_props, 'data-events')}"
+                ],
+            )
+        )
+
         eks_node_group_role.add_managed_policy(
             iam.ManagedPolicy.from_aws_managed_policy_name(
                 "SecretsManagerReadWrite"
@@ -208,50 +271,255 @@ class EksManagedStack(core.Stack):
         # TODO: use 2 nodegroup
         # - one for main application and log, monitor, redis, load balancer, etc
         # - one for nm pod
-        # https://github.com/awslabs/amazon-eks-ami/blob/master/files/eni-max-pods.txt
+        self_managed_node_groups = [
+            node_group_conf
+            for node_group_conf in env_props.eks_cluster_cfg.node_group
+            if node_group_conf.mode == "self_managed"
+        ]
+        if self_managed_node_groups:
+            # self managed nodes look up their warm pool state and complete
+            # their own launching lifecycle hook, see _add_self_managed_node_group
+            eks_node_group_role.add_to_policy(
+                iam.PolicyStatement(
+                    actions=[
+                        "autoscaling:DescribeAutoScalingInstances",
+                        "autoscaling:CompleteLifecycleAction",
+                    ],
+                    effect=iam.Effect.ALLOW,
+                    resources=["*"],
+                )
+            )
+        if len(self_managed_node_groups) == len(
+            env_props.eks_cluster_cfg.node_group
+        ):
+            # managed node groups already map the node role to aws-auth
+            cluster.aws_auth.add_role_mapping(
+                eks_node_group_role,
+                username="system:node:{{EC2PrivateDNSName}}",
+                groups=["system:bootstrappers", "system:nodes"],
+            )
+
         for node_group_conf in env_props.eks_cluster_cfg.node_group:
-            cluster.add_nodegroup_capacity(
-                f"eks-node-group-{node_group_conf.id_surfix}",
-                nodegroup_name=f"eks-node-group-{node_group_conf.id_surfix}",
+            nodegroup_name = f"eks-node-group-{node_group_conf.id_surfix}"
+
+            # the ENI based max pods of the EKS AMI doesn't know about prefix
+            # delegation, so those nodes always need our launch template.
+            # self managed nodes have no EKS default launch template at all.
+            # node tuning needs kubelet to register the startup taint
+            lt_conf = node_group_conf.launch_template
+            if lt_conf is None and (
+                vpc_cni_conf.prefix_delegation
+                or node_group_conf.mode == "self_managed"
+                or (
+                    node_group_conf.node_tuning is not None
+                    and node_group_conf.node_tuning.startup_taint
+                )
+            ):
+                lt_conf = EksLaunchTemplate()
+
+            # one AMI per node group, so all its instance types share the arch
+            node_group_archs = {
+                get_ec2_arch(instance_type)
+                for instance_type in node_group_conf.instance_type_l
+            }
+            if len(node_group_archs) > 1:
+                raise ValueError(
+                    f"node group {node_group_conf.id_surfix} mixes amd64 and arm64 instance types"
+                )
+            node_group_arch = node_group_archs.pop()
+
+            max_pods = None
+            if lt_conf is not None:
+                # a pool is as dense as its smallest instance type allows
+                max_pods_capacity = min(
+                    get_eks_max_pods(
+                        instance_type, vpc_cni_conf.prefix_delegation
+                    )
+                    for instance_type in node_group_conf.instance_type_l
+                )
+                max_pods = lt_conf.kubelet.max_pods
+                if max_pods is None and vpc_cni_conf.prefix_delegation:
+                    max_pods = max_pods_capacity
+                if max_pods is not None and max_pods > max_pods_capacity:
+                    raise ValueError(
+                        f"max_pods {max_pods} of node group {node_group_conf.id_surfix} "
+                        f"exceeds the {max_pods_capacity} pod IPs its instance types provide"
+                    )
+
+            # managed node groups label nodes with eks.amazonaws.com/capacityType,
+            # advertise it so cluster-autoscaler can scale spot pools from zero
+            node_group_tags = {
+                **node_group_conf.tags,
+                "k8s.io/cluster-autoscaler/node-template/label/eks.amazonaws.com/capacityType": node_group_conf.capacity_type,
+                "k8s.io/cluster-autoscaler/node-template/label/kubernetes.io/arch": node_group_arch,
+            }
+            # lets cluster-autoscaler know which pods fit a node group at zero size
+            for taint in node_group_conf.taints:
+                node_group_tags[
+                    f"k8s.io/cluster-autoscaler/node-template/taint/{taint.key}"
+                ] = f"{taint.value}:{taint.k8s_effect}"
+
+            if node_group_conf.mode == "self_managed":
+                assert lt_conf is not None
+                auto_scaling_group = self._add_self_managed_node_group(
+                    cluster,
+                    vpc,
+                    eks_node_group_role,
+                    nodegroup_name,
+                    node_group_conf,
+                    lt_conf,
+                    max_pods,
+                    node_group_arch,
+                    node_group_tags,
+                    image_vars={
+                        "account": core.Aws.ACCOUNT_ID,
+                        "region": core.Aws.REGION,
+                        "product_prefix": comm_props.product_prefix,
+                        "deploy_env": deploy_env,
+                    },
+                )
+                auto_scaling_group.node.add_dependency(vpc_cni_addon)
+                continue
+
+            launch_template_spec = None
+            if lt_conf is not None:
+                user_data = ec2.UserData.for_linux()
+                user_data.add_commands(*self._pre_bootstrap_commands(lt_conf))
+                user_data.add_commands(
+                    self._node_bootstrap_command(
+                        cluster,
+                        nodegroup_name,
+                        node_group_conf,
+                        lt_conf,
+                        max_pods,
+                    )
+                )
+                user_data.add_commands(*lt_conf.post_bootstrap_commands)
+
+                launch_template = self._create_node_launch_template(
+                    node_group_conf, lt_conf, user_data, node_group_arch
+                )
+                launch_template_spec = eks.LaunchTemplateSpec(
+                    id=launch_template.launch_template_id,  # type: ignore
+                    version=launch_template.latest_version_number,
+                )
+
+            nodegroup = cluster.add_nodegroup_capacity(
+                nodegroup_name,
+                nodegroup_name=nodegroup_name,
                 instance_types=[
-                    ec2.InstanceType(node_group_conf.instance_type)
+                    ec2.InstanceType(instance_type)
+                    for instance_type in node_group_conf.instance_type_l
                 ],
+                capacity_type=eks.CapacityType(node_group_conf.capacity_type),
                 min_size=node_group_conf.min_size,
                 max_size=node_group_conf.max_size,
                 node_role=eks_node_group_role,
                 labels=node_group_conf.label,
-                tags=node_group_conf.tags,
+                taints=[
+                    eks.TaintSpec(
+                        key=taint.key,
+                        value=taint.value,
+                        effect=eks.TaintEffect[taint.effect],
+                    )
+                    for taint in node_group_conf.taints
+                ]
+                or None,
+                tags=node_group_tags,
+                launch_template_spec=launch_template_spec,
+            )
+            # nodes must come up with the prefix delegation setting in place
+            nodegroup.node.add_dependency(vpc_cni_addon)
+
+        """ Fargate profiles """
+        # pods matching a profile start within seconds without waiting for EC2
+        # capacity, the backend sends small and overflowing jobs there
+        fargate_profiles_conf = env_props.eks_cluster_cfg.fargate_profiles
+        if fargate_profiles_conf:
+            fargate_log_group = logs.LogGroup(
+                self,
+                "log-group-eks-fargate",
+                log_group_name=f"/aws/eks/{id_gen(deploy_env, comm_props, 'eks-fargate')}",
+                removal_policy=core.RemovalPolicy.DESTROY,
+            )
+            # RetentionDays is a named enum in python, set the days directly
+            fargate_log_group.node.default_child.add_property_override(  # type: ignore
+                "RetentionInDays",
+                env_props.eks_cluster_cfg.fargate_log_retention_days,
             )
 
-            # eks_auto_auto_scaling_group = cluster.add_auto_scaling_group_capacity(
-            #     f"auto-scaling-group-{node_group_conf.id_surfix}",
-            #     auto_scaling_group_name=f"eks-auto-scaling-group-{node_group_conf.id_surfix}",
-            #     instance_type=ec2.InstanceType(node_group_conf.instance_type),
-            #     min_capacity=node_group_conf.min_size,
-            #     max_capacity=node_group_conf.max_size,
-            #     map_role=True,
-            #     group_metrics=[GroupMetrics.all()],
-            #     bootstrap_options=eks.BootstrapOptions(
-            #         kubelet_extra_args=f"--node-labels {node_group_conf.node_label.get('key')}={node_group_conf.node_label.get('value')} eks.amazonaws.com/nodegroup=node-group-{node_group_conf.node_label.get('value')}"
-            #     ),
-            # )
-
-            # eks_auto_auto_scaling_group = aws_autoscaling.AutoScalingGroup(
-            #     self,
-            #     f"auto-scaling-group-{node_group_conf.id_surfix}",
-            #     auto_scaling_group_name=f"eks-auto-scaling-group-{node_group_conf.id_surfix}",
-            #     instance_type=ec2.InstanceType(node_group_conf.instance_type),
-            #     machine_image=ec2.MachineImage.from_ssm_parameter("/aws/service/eks/optimized-ami/1.21/amazon-linux-2/recommended/image_id"),
-            #     min_capacity=node_group_conf.min_size,
-            #     max_capacity=node_group_conf.max_size,
-            #     role=eks_node_group_role,
-            #     group_metrics=[GroupMetrics.all()],
-            #     vpc=vpc,
-            # )
-            #
-            # cluster.connect_auto_scaling_group_capacity(
-            #     eks_auto_auto_scaling_group
-            # )
+            fargate_pod_execution_role = iam.Role(
+                self,
+                "eks-fargate-pod-execution-iam-role",
+                assumed_by=iam.ServicePrincipal("eks-fargate-pods.amazonaws.com"),
+                managed_policies=[
+                    iam.ManagedPolicy.from_aws_managed_policy_name(
+                        "AmazonEKSFargatePodExecutionRolePolicy"
+                    ),
+                ],
+            )
+            # the built-in fluent-bit of Fargate ships the pod logs
+            fargate_pod_execution_role.add_to_policy(
+                iam.PolicyStatement(
+                    actions=[
+                        "logs:CreateLogStream",
+                        "logs:DescribeLogStreams",
+                        "logs:PutLogEvents",
+                    ],
+                    effect=iam.Effect.ALLOW,
+                    resources=[fargate_log_group.log_group_arn],
+                )
+            )
+
+            cluster.add_manifest(
+                "eks-fargate-logging",
+                {
+                    "apiVersion": "v1",
+                    "kind": "Namespace",
+                    "metadata": {
+                        "name": "aws-observability",
+                        "labels": {"aws-observability": "enabled"},
+                    },
+                },
+                {
+                    "apiVersion": "v1",
+                    "kind": "ConfigMap",
+                    "metadata": {
+                        "name": "aws-logging",
+                        "namespace": "aws-observability",
+                    },
+                    "data": {
+                        "output.conf": "\n".join(
+                            [
+                                "[OUTPUT]",
+                                "    Name cloudwatch_logs",
+                                "    Match *",
+                                f"    region {env.region}",
+                                f"    log_group_name {fargate_log_group.log_group_name}",
+                                "    log_stream_prefix fargate-",
+                                "    auto_create_group false",
+                            ]
+                        ),
+                    },
+                },
+            )
+
+            for fargate_profile_conf in fargate_profiles_conf:
+                cluster.add_fargate_profile(
+                    f"eks-fargate-profile-{fargate_profile_conf.id_surfix}",
+                    fargate_profile_name=f"eks-fargate-profile-{fargate_profile_conf.id_surfix}",
+                    selectors=[
+                        eks.Selector(
+                            namespace=fargate_profile_conf.namespace,
+                            labels=fargate_profile_conf.labels or None,
+                        )
+                    ],
+                    pod_execution_role=fargate_pod_execution_role,
+                    # Fargate pods only run in private subnets
+                    subnet_selection=ec2.SubnetSelection(
+                        subnet_type=ec2.SubnetType.PRIVATE
+                    ),
+                )
 
         """ temp access for debugging """
         # grant AWS admin role as EKS cluster sys:master
@@ -353,3 +621,387 @@ class EksManagedStack(core.Stack):
         )
 
         eks_auto_scaling_policy.attach_to_role(eks_cluster_auto_scaler_role)
+
+    def _pre_bootstrap_commands(self, lt_conf: EksLaunchTemplate) -> List[str]:
+        commands = list(lt_conf.pre_bootstrap_commands)
+        if lt_conf.container_nofile is not None:
+            # bootstrap.sh restarts docker, which picks up the new default
+            nofile = {
+                "Name": "nofile",
+                "Soft": lt_conf.container_nofile,
+                "Hard": lt_conf.container_nofile,
+            }
+            commands += [
+                "jq '.\"default-ulimits\".nofile = "
+                + json.dumps(nofile)
+                + "' /etc/docker/daemon.json > /tmp/daemon.json",
+                "mv /tmp/daemon.json /etc/docker/daemon.json",
+            ]
+        if lt_conf.kubelet.eviction_hard:
+            # not a --eviction-hard flag: bootstrap.sh writes the kubelet extra
+            # args into a systemd drop-in, where the % of the thresholds is a
+            # specifier and breaks the whole KUBELET_EXTRA_ARGS line
+            commands += [
+                "jq '.evictionHard += "
+                + json.dumps(lt_conf.kubelet.eviction_hard)
+                + "' /etc/kubernetes/kubelet/kubelet-config.json > /tmp/kubelet-config.json",
+                "mv /tmp/kubelet-config.json /etc/kubernetes/kubelet/kubelet-config.json",
+            ]
+        return commands
+
+    def _node_bootstrap_command(
+        self,
+        cluster: eks.Cluster,
+        nodegroup_name: str,
+        node_group_conf: EksNodeGroup,
+        lt_conf: EksLaunchTemplate,
+        max_pods: Optional[int],
+    ) -> str:
+        """
+        Render the /etc/eks/bootstrap.sh call of a node.
+        Our launch templates pin the EKS optimized AMI, so EKS doesn't merge
+        its own user data and we have to call bootstrap.sh ourselves. This is
+        the only way to pass kubelet flags like max-pods to a managed node.
+        """
+        kubelet_conf = lt_conf.kubelet
+
+        # labels are normally set by EKS, with a custom AMI kubelet registers them
+        node_labels = {
+            **node_group_conf.label,
+            "eks.amazonaws.com/capacityType": node_group_conf.capacity_type,
+        }
+        if node_group_conf.mode == "managed":
+            node_labels["eks.amazonaws.com/nodegroup"] = nodegroup_name
+        kubelet_args = [
+            "--node-labels="
+            + ",".join(f"{key}={value}" for key, value in node_labels.items())
+        ]
+        # nodes register tainted, so no pod lands before the taints are in
+        # place. Self managed nodes get their taints only this way
+        register_taints = [
+            f"{taint.key}={taint.value}:{taint.k8s_effect}"
+            for taint in node_group_conf.taints
+        ]
+        if (
+            node_group_conf.node_tuning is not None
+            and node_group_conf.node_tuning.startup_taint
+        ):
+            register_taints.append(NODE_TUNING_TAINT)
+        if register_taints:
+            kubelet_args.append(
+                "--register-with-taints=" + ",".join(register_taints)
+            )
+        if max_pods is not None:
+            kubelet_args.append(f"--max-pods={max_pods}")
+        if kubelet_conf.image_gc_high_threshold_percent is not None:
+            kubelet_args.append(
+                f"--image-gc-high-threshold={kubelet_conf.image_gc_high_threshold_percent}"
+            )
+        if kubelet_conf.image_gc_low_threshold_percent is not None:
+            kubelet_args.append(
+                f"--image-gc-low-threshold={kubelet_conf.image_gc_low_threshold_percent}"
+            )
+        if kubelet_conf.cpu_manager is not None:
+            kubelet_args += [
+                "--cpu-manager-policy=static",
+                f"--reserved-cpus={kubelet_conf.cpu_manager.reserved_cpus}",
+                f"--topology-manager-policy={kubelet_conf.cpu_manager.topology_manager_policy}",
+            ]
+        if kubelet_conf.allowed_unsafe_sysctls:
+            kubelet_args.append(
+                "--allowed-unsafe-sysctls="
+                + ",".join(kubelet_conf.allowed_unsafe_sysctls)
+            )
+        kubelet_args.extend(kubelet_conf.extra_args)
+
+        bootstrap_args = [
+            cluster.cluster_name,
+            f"--b64-cluster-ca {cluster.cluster_certificate_authority_data}",
+            f"--apiserver-endpoint {cluster.cluster_endpoint}",
+        ]
+        if max_pods is not None:
+            # otherwise bootstrap.sh adds the ENI based max pods again
+            bootstrap_args.append("--use-max-pods false")
+        bootstrap_args.append(f"--kubelet-extra-args '{' '.join(kubelet_args)}'")
+
+        return f"/etc/eks/bootstrap.sh {' '.join(bootstrap_args)}"
+
+    @staticmethod
+    def _node_machine_image(
+        lt_conf: EksLaunchTemplate, arch: str
+    ) -> ec2.IMachineImage:
+        """
+        EKS optimized AMI of the node group. EksOptimizedImage resolves the
+        recommended AMI on every deployment, which rolls all node groups
+        whenever AWS publishes a new one. Here the AMI only changes with
+        ami_release_version, or when the cdk.context.json entry is reset.
+        """
+        kubernetes_version = EKS_KUBERNETES_VERSION.version
+        arch_suffix = "-arm64" if arch == "arm64" else ""
+        parameter_prefix = f"/aws/service/eks/optimized-ami/{kubernetes_version}/amazon-linux-2{arch_suffix}"
+        if lt_conf.ami_release_version is not None:
+            return ec2.MachineImage.from_ssm_parameter(
+                f"{parameter_prefix}/amazon-eks{arch_suffix}-node-{kubernetes_version}-{lt_conf.ami_release_version}/image_id",
+                os=ec2.OperatingSystemType.LINUX,
+            )
+        return ec2.MachineImage.from_ssm_parameter(
+            f"{parameter_prefix}/recommended/image_id",
+            os=ec2.OperatingSystemType.LINUX,
+            cached_in_context=True,
+        )
+
+    def _create_node_launch_template(
+        self,
+        node_group_conf: EksNodeGroup,
+        lt_conf: EksLaunchTemplate,
+        user_data: ec2.UserData,
+        arch: str,
+        instance_type: Optional[str] = None,
+        role: Optional[iam.IRole] = None,
+        security_group: Optional[ec2.ISecurityGroup] = None,
+    ) -> ec2.LaunchTemplate:
+        """
+        Create the launch template of a node group. Managed node groups set
+        instance type, instance profile and security group themselves, so
+        only self managed node groups pass them here.
+        """
+        root_volume = lt_conf.root_volume
+        launch_template = ec2.LaunchTemplate(
+            self,
+            f"launch-template-{node_group_conf.id_surfix}",
+            machine_image=self._node_machine_image(lt_conf, arch),
+            user_data=user_data,
+            instance_type=ec2.InstanceType(instance_type)
+            if instance_type
+            else None,
+            role=role,
+            security_group=security_group,
+            block_devices=[
+                ec2.BlockDevice(
+                    device_name="/dev/xvda",
+                    volume=ec2.BlockDeviceVolume.ebs(
+                        root_volume.volume_gb,
+                        volume_type=ec2.EbsDeviceVolumeType[
+                            root_volume.volume_type.upper()
+                        ],
+                        iops=root_volume.iops,
+                        delete_on_termination=True,
+                        encrypted=True,
+                    ),
+                )
+            ],
+        )
+
+        # BlockDeviceVolume doesn't support gp3 throughput in this CDK version
+        if root_volume.throughput_mibps is not None:
+            launch_template.node.default_child.add_property_override(  # type: ignore
+                "LaunchTemplateData.BlockDeviceMappings.0.Ebs.Throughput",
+                root_volume.throughput_mibps,
+            )
+
+        return launch_template
+
+    def _add_self_managed_node_group(
+        self,
+        cluster: eks.Cluster,
+        vpc: ec2.Vpc,
+        node_role: iam.IRole,
+        nodegroup_name: str,
+        node_group_conf: EksNodeGroup,
+        lt_conf: EksLaunchTemplate,
+        max_pods: Optional[int],
+        arch: str,
+        node_group_tags: Dict[str, str],
+        image_vars: Dict[str, str],
+    ) -> autoscaling.CfnAutoScalingGroup:
+        """
+        Create an auto scaling group joining the cluster, optionally backed by
+        a warm pool of stopped instances which already pulled our images.
+
+        A warm instance boots twice: once into the warm pool, where it only
+        pulls images and must not join the cluster, and once when it moves
+        into the group. User data only runs on the first boot, so it installs
+        a cloud-init per-boot script which checks the lifecycle state, runs
+        bootstrap.sh once the instance is in service, and completes the
+        launching lifecycle hook in both cases.
+        """
+        warm_pool_conf = node_group_conf.warm_pool
+        launching_hook = node_group_conf.launching_hook
+        boot_script_path = "/var/lib/cloud/scripts/per-boot/eks-node-boot.sh"
+
+        boot_script = [
+            "#!/bin/bash",
+            "set -o errexit -o pipefail",
+            'IMDS_TOKEN=$(curl -s -X PUT "http://169.254.169.254/latest/api/token" -H "X-aws-ec2-metadata-token-ttl-seconds: 300")',
+            'INSTANCE_ID=$(curl -s -H "X-aws-ec2-metadata-token: $IMDS_TOKEN" http://169.254.169.254/latest/meta-data/instance-id)',
+            'export AWS_DEFAULT_REGION=$(curl -s -H "X-aws-ec2-metadata-token: $IMDS_TOKEN" http://169.254.169.254/latest/meta-data/placement/region)',
+            "# the instance shows up in the auto scaling group a few seconds after boot",
+            "for i in $(seq 1 60); do",
+            "  # a transient API error must not abort the boot under errexit, just retry",
+            "  LIFECYCLE_STATE=$(aws autoscaling describe-auto-scaling-instances --instance-ids $INSTANCE_ID --query 'AutoScalingInstances[0].LifecycleState' --output text || true)",
+            '  [ -n "$LIFECYCLE_STATE" ] && [ "$LIFECYCLE_STATE" != "None" ] && break',
+            "  sleep 5",
+            "done",
+            'if [[ "$LIFECYCLE_STATE" == Warmed:* ]]; then',
+            "  # initialising into the warm pool: pull images, don't join the cluster",
+            "  systemctl start docker",
+        ]
+        prepull_images = (
+            [
+                image.format(**image_vars)
+                for image in warm_pool_conf.prepull_images
+            ]
+            if warm_pool_conf is not None
+            else []
+        )
+        ecr_registries = sorted(
+            {
+                image.split("/")[0]
+                for image in prepull_images
+                if ".dkr.ecr." in image
+            }
+        )
+        for registry in ecr_registries:
+            boot_script.append(
+                f"  aws ecr get-login-password | docker login --username AWS --password-stdin {registry}"
+            )
+        for image in prepull_images:
+            boot_script.append(f"  docker pull {image}")
+        boot_script += [
+            "elif [ ! -f /var/lib/eks-node-bootstrapped ]; then",
+            "  "
+            + self._node_bootstrap_command(
+                cluster, nodegroup_name, node_group_conf, lt_conf, max_pods
+            ),
+            *[f"  {command}" for command in lt_conf.post_bootstrap_commands],
+            "  touch /var/lib/eks-node-bootstrapped",
+            "fi",
+        ]
+        if launching_hook is not None:
+            # fails when there is no pending hook, e.g. on a plain reboot
+            boot_script.append(
+                f"aws autoscaling complete-lifecycle-action --auto-scaling-group-name {nodegroup_name} "
+                f"--lifecycle-hook-name {launching_hook.name} --instance-id $INSTANCE_ID "
+                "--lifecycle-action-result CONTINUE || true"
+            )
+
+        user_data = ec2.UserData.for_linux()
+        user_data.add_commands(*self._pre_bootstrap_commands(lt_conf))
+        user_data.add_commands(
+            f"mkdir -p {os.path.dirname(boot_script_path)}",
+            f"cat > {boot_script_path} <<'EOF'",
+            *boot_script,
+            "EOF",
+            f"chmod +x {boot_script_path}",
+            # cloud-init already ran the per-boot scripts of this first boot
+            boot_script_path,
+        )
+
+        instance_type_l = node_group_conf.instance_type_l
+        mixed_instances = (
+            len(instance_type_l) > 1 or node_group_conf.capacity_type == "SPOT"
+        )
+        launch_template = self._create_node_launch_template(
+            node_group_conf,
+            lt_conf,
+            user_data,
+            arch,
+            instance_type=None if mixed_instances else instance_type_l[0],
+            role=node_role,
+            # the same security group EKS attaches to managed nodes
+            security_group=cluster.cluster_security_group,
+        )
+        launch_template_spec = autoscaling.CfnAutoScalingGroup.LaunchTemplateSpecificationProperty(
+            launch_template_id=launch_template.launch_template_id,
+            version=launch_template.latest_version_number,
+        )
+
+        mixed_instances_policy = None
+        if mixed_instances:
+            spot = node_group_conf.capacity_type == "SPOT"
+            mixed_instances_policy = autoscaling.CfnAutoScalingGroup.MixedInstancesPolicyProperty(
+                launch_template=autoscaling.CfnAutoScalingGroup.LaunchTemplateProperty(
+                    launch_template_specification=launch_template_spec,
+                    overrides=[
+                        autoscaling.CfnAutoScalingGroup.LaunchTemplateOverridesProperty(
+                            instance_type=instance_type
+                        )
+                        for instance_type in instance_type_l
+                    ],
+                ),
+                instances_distribution=autoscaling.CfnAutoScalingGroup.InstancesDistributionProperty(
+                    on_demand_base_capacity=0,
+                    on_demand_percentage_above_base_capacity=0 if spot else 100,
+                    on_demand_allocation_strategy=None
+                    if spot
+                    else node_group_conf.allocation_strategy,
+                    spot_allocation_strategy=node_group_conf.allocation_strategy
+                    if spot
+                    else None,
+                ),
+            )
+
+        asg_tags = {
+            "Name": nodegroup_name,
+            f"kubernetes.io/cluster/{cluster.cluster_name}": "owned",
+            # managed node groups get the autoscaler discovery tags from EKS
+            "k8s.io/cluster-autoscaler/enabled": "true",
+            f"k8s.io/cluster-autoscaler/{cluster.cluster_name}": "owned",
+            **node_group_tags,
+        }
+
+        lifecycle_transition = {
+            "launching": "autoscaling:EC2_INSTANCE_LAUNCHING",
+            "terminating": "autoscaling:EC2_INSTANCE_TERMINATING",
+        }
+        auto_scaling_group = autoscaling.CfnAutoScalingGroup(
+            self,
+            f"auto-scaling-group-{node_group_conf.id_surfix}",
+            auto_scaling_group_name=nodegroup_name,
+            min_size=str(node_group_conf.min_size),
+            max_size=str(node_group_conf.max_size),
+            launch_template=None if mixed_instances else launch_template_spec,
+            mixed_instances_policy=mixed_instances_policy,
+            capacity_rebalance=node_group_conf.capacity_type == "SPOT",
+            vpc_zone_identifier=vpc.select_subnets(
+                subnet_type=ec2.SubnetType.PRIVATE
+            ).subnet_ids,
+            metrics_collection=[
+                autoscaling.CfnAutoScalingGroup.MetricsCollectionProperty(
+                    granularity="1Minute"
+                )
+            ],
+            # hooks must exist before the first instance launches
+            lifecycle_hook_specification_list=[
+                autoscaling.CfnAutoScalingGroup.LifecycleHookSpecificationProperty(
+                    lifecycle_hook_name=hook.name,
+                    lifecycle_transition=lifecycle_transition[hook.transition],
+                    heartbeat_timeout=hook.heartbeat_timeout_sec,
+                    default_result=hook.default_result,
+                )
+                for hook in node_group_conf.lifecycle_hooks
+            ],
+            tags=[
+                autoscaling.CfnAutoScalingGroup.TagPropertyProperty(
+                    key=key, value=value, propagate_at_launch=True
+                )
+                for key, value in asg_tags.items()
+            ],
+        )
+
+        if warm_pool_conf is not None:
+            warm_pool = autoscaling.CfnWarmPool(
+                self,
+                f"warm-pool-{node_group_conf.id_surfix}",
+                auto_scaling_group_name=auto_scaling_group.ref,
+                min_size=warm_pool_conf.min_size,
+                max_group_prepared_capacity=warm_pool_conf.max_group_prepared_capacity,
+                pool_state="Stopped",
+            )
+            # InstanceReusePolicy is newer than this CDK version
+            if warm_pool_conf.reuse_on_scale_in:
+                warm_pool.add_property_override(
+                    "InstanceReusePolicy", {"ReuseOnScaleIn": True}
+                )
+
+        return auto_scaling_group
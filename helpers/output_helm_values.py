@@ -0,0 +1,277 @@
+# This is an auxiliary program to output helm values derived from the env props
+# Reason:
+# - some chart values depend on the infrastructure config, e.g. node group names
+# - bash seems not have a good yaml parser
+# Usage: python -m helpers.output_helm_values dev aws-plugins > values.dev.yaml
+
+import sys
+from typing import Any, Dict, List
+
+import yaml
+
+from helpers.prop_loader import EksNodeGroup, EnvDepProperties
+
+# managed node groups run in ASGs named eks-<node group name>-<uuid>
+ASG_NAME_PATTERN = (
+    r"^(eks-)?eks-node-group-{id_surfix}"
+    r"(-[0-9a-f]{{8}}-[0-9a-f]{{4}}-[0-9a-f]{{4}}-[0-9a-f]{{4}}-[0-9a-f]{{12}})?$"
+)
+
+
+def node_group_tolerations(node_group: EksNodeGroup) -> List[Dict]:
+    return [
+        {
+            "key": taint.key,
+            "operator": "Equal",
+            "value": taint.value,
+            "effect": taint.k8s_effect,
+        }
+        for taint in node_group.taints
+    ]
+
+
+def node_group_by_id(env_props: EnvDepProperties) -> Dict[str, EksNodeGroup]:
+    return {
+        node_group.id_surfix: node_group
+        for node_group in env_props.eks_cluster_cfg.node_group
+    }
+
+
+def workload_scheduling(env_props: EnvDepProperties, workload: str) -> Dict:
+    """
+    nodeSelector and tolerations of the node groups a workload is placed on.
+    Several node groups are selected by node affinity match expressions on
+    their label instead, next to the architectures of the image
+    """
+    id_surfixes = env_props.eks_cluster_cfg.workload_placement.get(workload)
+    if id_surfixes is None:
+        return {}
+    node_groups = [node_group_by_id(env_props)[id_surfix] for id_surfix in id_surfixes]
+    tolerations: List[Dict] = []
+    for node_group in node_groups:
+        for toleration in node_group_tolerations(node_group):
+            if toleration not in tolerations:
+                tolerations.append(toleration)
+    if len(node_groups) == 1:
+        return {
+            "node_selector": node_groups[0].label,
+            "node_match_expressions": [],
+            "tolerations": tolerations,
+        }
+    return {
+        # null drops the nodeSelector default of the charts
+        "node_selector": None,
+        "node_match_expressions": [
+            {
+                "key": key,
+                "operator": "In",
+                "values": sorted({node_group.label[key] for node_group in node_groups}),
+            }
+            for key in node_groups[0].label
+        ],
+        "tolerations": tolerations,
+    }
+
+
+def overprovisioning_values(env_props: EnvDepProperties) -> Dict:
+    overprovisioning_conf = env_props.eks_cluster_cfg.overprovisioning
+    node_groups = node_group_by_id(env_props)
+    return {
+        "business_hours_start": overprovisioning_conf.business_hours_start,
+        "business_hours_end": overprovisioning_conf.business_hours_end,
+        "pools": {
+            id_surfix: {
+                "replicas": pool.replicas,
+                "business_hours_replicas": pool.business_hours_replicas,
+                "cpu": pool.cpu,
+                "memory": pool.memory,
+                "node_selector": node_groups[id_surfix].label,
+                "tolerations": node_group_tolerations(node_groups[id_surfix]),
+            }
+            for id_surfix, pool in overprovisioning_conf.pools.items()
+        },
+    }
+
+
+def node_tuning_values(env_props: EnvDepProperties) -> Dict:
+    # the daemon sets select nodes by label, node groups sharing a label (e.g.
+    # a warm pool fallback) share one daemon set. EksClusterCfg makes sure
+    # they have the same node tuning
+    pools: Dict[str, Dict] = {}
+    for node_group in env_props.eks_cluster_cfg.node_group:
+        if node_group.node_tuning is None:
+            continue
+        pool_name = "-".join(str(value) for value in node_group.label.values())
+        pools[pool_name] = {
+            "node_selector": node_group.label,
+            "sysctls": node_group.node_tuning.sysctls,
+            "transparent_hugepage": node_group.node_tuning.transparent_hugepage,
+        }
+    return {"pools": pools}
+
+
+def aws_plugins_values(env_props: EnvDepProperties) -> Dict:
+    autoscaler_conf = env_props.eks_cluster_cfg.cluster_autoscaler
+    priorities: Dict[int, List[str]] = {
+        priority: [
+            ASG_NAME_PATTERN.format(id_surfix=id_surfix)
+            for id_surfix in id_surfixes
+        ]
+        for priority, id_surfixes in autoscaler_conf.priorities.items()
+    }
+    if priorities:
+        # node groups without priority are only used when nothing else fits
+        priorities.setdefault(0, []).append(".*")
+
+    return {
+        "autoscaler": {
+            "scan_interval": autoscaler_conf.scan_interval,
+            "new_pod_scale_up_delay": autoscaler_conf.new_pod_scale_up_delay,
+            "scale_down_delay_after_add": autoscaler_conf.scale_down_delay_after_add,
+            "scale_down_unneeded_time": autoscaler_conf.scale_down_unneeded_time,
+            "scale_down_utilization_threshold": autoscaler_conf.scale_down_utilization_threshold,
+            "max_node_provision_time": autoscaler_conf.max_node_provision_time,
+            "expander": autoscaler_conf.expander,
+            "priorities": priorities,
+        },
+        "overprovisioning": overprovisioning_values(env_props),
+        "node-tuning": node_tuning_values(env_props),
+    }
+
+
+# uniframe chart component -> workload
+UNIFRAME_COMPONENT_WORKLOADS = {
+    "backend": "api",
+    "frontend": "api",
+    "doc": "api",
+    "housekeeper": "api",
+    # rq workers run the matching jobs queued by the backend
+    "worker": "matching",
+}
+# workloads the backend launches as kubernetes jobs
+UNIFRAME_JOB_WORKLOADS = ["matching", "matching-large"]
+# job size class of the jobs chart -> workload
+UNIFRAME_JOB_SIZE_CLASSES = {
+    "small": "matching",
+    "medium": "matching",
+    "large": "matching-large",
+}
+
+
+def uniframe_values(env_props: EnvDepProperties) -> Dict:
+    values: Dict = {
+        component: {"scheduling": workload_scheduling(env_props, workload)}
+        for component, workload in UNIFRAME_COMPONENT_WORKLOADS.items()
+    }
+    for component, component_values in values.items():
+        if component_values["scheduling"]:
+            # spread replicas, so losing a node doesn't take a whole component
+            component_values["scheduling"]["affinity"] = {
+                "podAntiAffinity": {
+                    "preferredDuringSchedulingIgnoredDuringExecution": [
+                        {
+                            "weight": 100,
+                            "podAffinityTerm": {
+                                "labelSelector": {
+                                    "matchLabels": {"app": component}
+                                },
+                                "topologyKey": "kubernetes.io/hostname",
+                            },
+                        }
+                    ]
+                }
+            }
+    job_scheduling = {
+        workload: workload_scheduling(env_props, workload)
+        for workload in UNIFRAME_JOB_WORKLOADS
+        if workload in env_props.eks_cluster_cfg.workload_placement
+    }
+    # Fargate pods are selected by namespace and labels, not by node
+    for fargate_profile in env_props.eks_cluster_cfg.fargate_profiles:
+        job_scheduling[fargate_profile.workload] = {
+            "fargate": True,
+            "namespace": fargate_profile.namespace,
+            "labels": fargate_profile.labels,
+            "overflow_of": fargate_profile.overflow_of,
+        }
+    values["global"] = {"job_scheduling": job_scheduling}
+    # CloudFront of the CdnStack takes over <hostname_prefix>.<domain>
+    if env_props.cdn is not None:
+        for component, site_conf in env_props.cdn.sites.items():
+            values.setdefault(component, {})["ingress"] = {
+                "origin_hostname_prefix": site_conf.origin_hostname_prefix
+            }
+    values["jobs"] = {
+        "size_classes": {
+            size_class: {"scheduling": workload_scheduling(env_props, workload)}
+            for size_class, workload in UNIFRAME_JOB_SIZE_CLASSES.items()
+        }
+    }
+    return values
+
+
+def prometheus_values(env_props: EnvDepProperties) -> Dict:
+    scheduling = workload_scheduling(env_props, "monitoring")
+    if not scheduling:
+        return {}
+    pod_scheduling = {
+        "nodeSelector": scheduling["node_selector"],
+        "tolerations": scheduling["tolerations"],
+    }
+    if scheduling["node_match_expressions"]:
+        pod_scheduling["affinity"] = {
+            "nodeAffinity": {
+                "requiredDuringSchedulingIgnoredDuringExecution": {
+                    "nodeSelectorTerms": [
+                        {"matchExpressions": scheduling["node_match_expressions"]}
+                    ]
+                }
+            }
+        }
+    return {
+        "prometheus": {"prometheusSpec": pod_scheduling},
+        "alertmanager": {"alertmanagerSpec": pod_scheduling},
+        "grafana": pod_scheduling,
+        # the admission webhook patch job is a pre-install hook, helm waits for it
+        "prometheusOperator": {
+            **pod_scheduling,
+            "admissionWebhooks": {"patch": pod_scheduling},
+        },
+        "kube-state-metrics": pod_scheduling,
+    }
+
+
+class NoAliasDumper(yaml.SafeDumper):
+    # node groups are shared between workloads, helm values read better without anchors
+    def ignore_aliases(self, data: Any) -> bool:
+        return True
+
+
+CHART_VALUES = {
+    "aws-plugins": aws_plugins_values,
+    "uniframe": uniframe_values,
+    "prometheus": prometheus_values,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) <= 2:
+        exit("Must input deployment environment and chart")
+
+    deploy_env = sys.argv[1]
+    if deploy_env not in ['dev', 'prod']:
+        exit("Deployment environment must be dev or prod")
+
+    chart = sys.argv[2]
+    if chart not in CHART_VALUES:
+        exit(f"Chart must be one of {', '.join(CHART_VALUES)}")
+
+    env_props = EnvDepProperties.load(f"./conf/env_props.{deploy_env}.yaml")
+
+    print(
+        yaml.dump(
+            CHART_VALUES[chart](env_props),
+            Dumper=NoAliasDumper,
+            sort_keys=False,
+        ),
+        end="",
+    )
@@ -0,0 +1,20 @@
+# This is an auxiliary program to output the redis tiers of the CacheStack
+# Reason:
+# - helm-install-uniframe.sh reads the endpoints of each tier from the parameter store
+# - bash seems not have a good yaml parser
+
+import sys
+
+from helpers.prop_loader import EnvDepProperties
+
+if __name__ == '__main__':
+    if len(sys.argv) <= 1:
+        exit("Must input deployment environment")
+
+    deploy_env = sys.argv[1]
+    if deploy_env not in ['dev', 'prod']:
+        exit("Deployment environment must be dev or prod")
+
+    env_props = EnvDepProperties.load(f"./conf/env_props.{deploy_env}.yaml")
+
+    print(" ".join(env_props.cache.tiers))
@@ -1,8 +1,10 @@
+import json
+import re
 import yaml
 from typing import List, Optional, Dict
 
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, root_validator, validator
 from aws_cdk import aws_ecs as ecs
 
 
@@ -39,15 +41,319 @@ class EbsStorage(BaseModel):
     general_storage: StorageConfig
 
 
+class EbsRootVolume(BaseModel):
+    volume_type: str = "gp3"
+    volume_gb: int = 20
+    # only for gp3 (iops and throughput) and io1 (iops)
+    iops: Optional[int] = None
+    throughput_mibps: Optional[int] = None
+
+    @validator("volume_type")
+    def check_volume_type(cls, v: str) -> str:
+        if v not in ["gp2", "gp3", "io1"]:
+            raise ValueError(f"volume_type must be gp2, gp3 or io1, got {v}")
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def check_performance(cls, values: Dict) -> Dict:
+        volume_type = values["volume_type"]
+        if values.get("throughput_mibps") is not None and volume_type != "gp3":
+            raise ValueError("throughput_mibps can only be set for gp3 volumes")
+        if values.get("iops") is not None and volume_type == "gp2":
+            raise ValueError("iops can not be set for gp2 volumes")
+        if values.get("iops") is None and volume_type == "io1":
+            raise ValueError("io1 volumes need iops")
+        return values
+
+
+class CpuManagerConfig(BaseModel):
+    # static CPU manager policy: Guaranteed pods with integer CPU requests
+    # get exclusive cores instead of sharing CFS quota with everything else
+    # cpus kept for system daemons and burstable pods, e.g. "0" or "0,1"
+    reserved_cpus: str = "0"
+    topology_manager_policy: str = "single-numa-node"
+
+    @validator("topology_manager_policy")
+    def check_topology_manager_policy(cls, v: str) -> str:
+        if v not in ["none", "best-effort", "restricted", "single-numa-node"]:
+            raise ValueError(
+                f"topology_manager_policy must be none, best-effort, restricted or single-numa-node, got {v}"
+            )
+        return v
+
+
+class KubeletConfig(BaseModel):
+    # None keeps the ENI based max pods of the EKS AMI
+    max_pods: Optional[int] = None
+    # e.g. {"memory.available": "200Mi", "nodefs.available": "10%"}
+    eviction_hard: Dict[str, str] = {}
+    image_gc_high_threshold_percent: Optional[int] = None
+    image_gc_low_threshold_percent: Optional[int] = None
+    # None keeps the default (none) CPU manager policy
+    cpu_manager: Optional[CpuManagerConfig] = None
+    # namespaced sysctls pods may set in their security context,
+    # e.g. net.core.somaxconn for the API
+    allowed_unsafe_sysctls: List[str] = []
+    # any other kubelet flag, e.g. "--serialize-image-pulls=false"
+    extra_args: List[str] = []
+
+    @root_validator(skip_on_failure=True)
+    def check_image_gc_threshold(cls, values: Dict) -> Dict:
+        high = values.get("image_gc_high_threshold_percent")
+        low = values.get("image_gc_low_threshold_percent")
+        if high is not None and low is not None and low >= high:
+            raise ValueError(
+                "image_gc_low_threshold_percent must be lower than image_gc_high_threshold_percent"
+            )
+        return values
+
+
+class EksLaunchTemplate(BaseModel):
+    # release of the EKS optimized AMI, e.g. v20230217. Without, the AMI
+    # recommended at the first synth is cached in cdk.context.json. Nodes
+    # only roll over when either changes
+    ami_release_version: Optional[str] = None
+    root_volume: EbsRootVolume = EbsRootVolume()
+    kubelet: KubeletConfig = KubeletConfig()
+    # docker default nofile ulimit (soft and hard) of the containers
+    container_nofile: Optional[int] = None
+    # shell commands run in user data before/after /etc/eks/bootstrap.sh
+    pre_bootstrap_commands: List[str] = []
+    post_bootstrap_commands: List[str] = []
+
+    @validator("ami_release_version")
+    def check_ami_release_version(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and not re.fullmatch(r"v\d{8}", v):
+            raise ValueError(f"ami_release_version must be like v20230217, got {v}")
+        return v
+
+
+class NodeTuning(BaseModel):
+    # applied by the node-tuning daemon set of aws-plugins
+    # host sysctls, e.g. {"net.netfilter.nf_conntrack_max": "262144"}
+    sysctls: Dict[str, str] = {}
+    # always, madvise or never, None keeps the AMI default
+    transparent_hugepage: Optional[str] = None
+    # nodes stay tainted until the daemon set has applied and verified the
+    # tuning. Off for the node group of the system pods (CoreDNS, the
+    # controllers of aws-plugins), which must schedule before it is installed
+    startup_taint: bool = True
+
+    @validator("transparent_hugepage")
+    def check_transparent_hugepage(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and v not in ["always", "madvise", "never"]:
+            raise ValueError(
+                f"transparent_hugepage must be always, madvise or never, got {v}"
+            )
+        return v
+
+
+class EksWarmPool(BaseModel):
+    # warm instances are always kept stopped: kubelet is started by a
+    # per-boot script, which doesn't run for running or hibernated pools
+    min_size: int = 0
+    # None means the warm pool grows to the node group max_size
+    max_group_prepared_capacity: Optional[int] = None
+    reuse_on_scale_in: bool = False
+    # pulled while the instance is initialised into the warm pool.
+    # {account}, {region}, {product_prefix} and {deploy_env} are substituted
+    prepull_images: List[str] = []
+
+
+class EksLifecycleHook(BaseModel):
+    name: str
+    transition: str
+    heartbeat_timeout_sec: int = 300
+    default_result: str = "CONTINUE"
+
+    @validator("transition")
+    def check_transition(cls, v: str) -> str:
+        if v not in ["launching", "terminating"]:
+            raise ValueError(
+                f"transition must be launching or terminating, got {v}"
+            )
+        return v
+
+    @validator("default_result")
+    def check_default_result(cls, v: str) -> str:
+        if v not in ["CONTINUE", "ABANDON"]:
+            raise ValueError(
+                f"default_result must be CONTINUE or ABANDON, got {v}"
+            )
+        return v
+
+
+class EksTaint(BaseModel):
+    key: str
+    value: str
+    effect: str = "NO_SCHEDULE"
+
+    @validator("effect")
+    def check_effect(cls, v: str) -> str:
+        if v not in ["NO_SCHEDULE", "PREFER_NO_SCHEDULE", "NO_EXECUTE"]:
+            raise ValueError(
+                f"effect must be NO_SCHEDULE, PREFER_NO_SCHEDULE or NO_EXECUTE, got {v}"
+            )
+        return v
+
+    @property
+    def k8s_effect(self) -> str:
+        return {
+            "NO_SCHEDULE": "NoSchedule",
+            "PREFER_NO_SCHEDULE": "PreferNoSchedule",
+            "NO_EXECUTE": "NoExecute",
+        }[self.effect]
+
+
 class EksNodeGroup(BaseModel):
     id_surfix: str
-    instance_type: str
+    # managed: EKS managed node group
+    # self_managed: our own auto scaling group, needed for warm pools
+    mode: str = "managed"
+    # either a single instance type, or a list of interchangeable types
+    # (same vCPU and memory) to diversify the pool. The first type in the
+    # list is the one cluster-autoscaler uses as node template.
+    instance_type: Optional[str] = None
+    instance_types: Optional[List[str]] = None
+    capacity_type: str = "ON_DEMAND"
+    # EKS managed node groups don't let us choose the allocation strategy:
+    # on-demand follows the instance type order ("prioritized") and spot
+    # uses "capacity-optimized". Leave it empty to get the default.
+    allocation_strategy: Optional[str] = None
     min_size: int
     max_size: int
     label: dict
     node_label: dict
     tags: dict
-    taints: dict
+    # only pods tolerating them run on the node group, autoscaler tags are generated
+    taints: List[EksTaint] = []
+    # without it, the node group uses the EKS default launch template
+    launch_template: Optional[EksLaunchTemplate] = None
+    # self_managed only
+    warm_pool: Optional[EksWarmPool] = None
+    # self_managed only, a launching hook is completed by the node user data
+    # once kubelet is started (or once images are pulled in the warm pool)
+    lifecycle_hooks: List[EksLifecycleHook] = []
+    # needs a launch template, the startup taint is registered by kubelet
+    node_tuning: Optional[NodeTuning] = None
+
+    @validator("mode")
+    def check_mode(cls, v: str) -> str:
+        if v not in ["managed", "self_managed"]:
+            raise ValueError(f"mode must be managed or self_managed, got {v}")
+        return v
+
+    @validator("capacity_type")
+    def check_capacity_type(cls, v: str) -> str:
+        if v not in ["ON_DEMAND", "SPOT"]:
+            raise ValueError(
+                f"capacity_type must be ON_DEMAND or SPOT, got {v}"
+            )
+        return v
+
+    @validator("lifecycle_hooks")
+    def check_lifecycle_hooks(
+        cls, v: List[EksLifecycleHook]
+    ) -> List[EksLifecycleHook]:
+        if len([hook for hook in v if hook.transition == "launching"]) > 1:
+            raise ValueError("only one launching lifecycle hook is supported")
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def check_cpu_manager(cls, values: Dict) -> Dict:
+        launch_template = values.get("launch_template")
+        if launch_template is None or launch_template.kubelet.cpu_manager is None:
+            return values
+        # exclusive cores of burstable instances are still bound by CPU credits
+        instance_types = values.get("instance_types") or [
+            values.get("instance_type")
+        ]
+        burstable = [
+            instance_type
+            for instance_type in instance_types
+            if instance_type and instance_type.startswith("t")
+        ]
+        if burstable:
+            raise ValueError(
+                f"cpu_manager needs non-burstable instance types, got {burstable}"
+            )
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def check_instance_types(cls, values: Dict) -> Dict:
+        if bool(values.get("instance_type")) == bool(
+            values.get("instance_types")
+        ):
+            raise ValueError(
+                "node group must define exactly one of instance_type and instance_types"
+            )
+
+        capacity_type = values["capacity_type"]
+        default_strategy = {
+            "ON_DEMAND": "prioritized",
+            "SPOT": "capacity-optimized",
+        }[capacity_type]
+        if values.get("allocation_strategy") is None:
+            values["allocation_strategy"] = default_strategy
+        elif values["mode"] == "managed":
+            if values["allocation_strategy"] != default_strategy:
+                raise ValueError(
+                    f"managed node group with {capacity_type} capacity only supports "
+                    f"allocation_strategy {default_strategy}"
+                )
+        else:
+            strategies = {
+                "ON_DEMAND": ["prioritized", "lowest-price"],
+                "SPOT": [
+                    "capacity-optimized",
+                    "capacity-optimized-prioritized",
+                    "price-capacity-optimized",
+                    "lowest-price",
+                ],
+            }[capacity_type]
+            if values["allocation_strategy"] not in strategies:
+                raise ValueError(
+                    f"allocation_strategy for {capacity_type} capacity must be one of {strategies}"
+                )
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def check_self_managed(cls, values: Dict) -> Dict:
+        if values["mode"] == "managed":
+            if values.get("warm_pool") or values.get("lifecycle_hooks"):
+                raise ValueError(
+                    "warm_pool and lifecycle_hooks need mode self_managed"
+                )
+        elif values.get("warm_pool") is not None:
+            # EC2 Auto Scaling restriction
+            if values["capacity_type"] != "ON_DEMAND" or values.get(
+                "instance_types"
+            ):
+                raise ValueError(
+                    "warm pools only support ON_DEMAND capacity with a single instance_type"
+                )
+            # without the hook, the instance is stopped before images are pulled
+            if values["warm_pool"].prepull_images and not any(
+                hook.transition == "launching"
+                for hook in values["lifecycle_hooks"]
+            ):
+                raise ValueError(
+                    "warm pool prepull_images needs a launching lifecycle hook"
+                )
+        return values
+
+    @property
+    def instance_type_l(self) -> List[str]:
+        if self.instance_types:
+            return self.instance_types
+        return [self.instance_type]  # type: ignore
+
+    @property
+    def launching_hook(self) -> Optional[EksLifecycleHook]:
+        for hook in self.lifecycle_hooks:
+            if hook.transition == "launching":
+                return hook
+        return None
 
 
 class WhitelistIP(BaseModel):
@@ -56,9 +362,592 @@ class WhitelistIP(BaseModel):
     enable_80: Optional[bool] = True
 
 
+class VpcCniConfig(BaseModel):
+    # add-on version must support configuration values (v1.9+ for prefix delegation)
+    addon_version: Optional[str] = None
+    # assign /28 prefixes instead of single IPs to ENIs, nitro instances only
+    prefix_delegation: bool = False
+    warm_prefix_target: Optional[int] = None
+    warm_ip_target: Optional[int] = None
+    minimum_ip_target: Optional[int] = None
+
+    @root_validator(skip_on_failure=True)
+    def check_warm_prefix_target(cls, values: Dict) -> Dict:
+        if (
+            values.get("warm_prefix_target") is not None
+            and not values["prefix_delegation"]
+        ):
+            raise ValueError("warm_prefix_target needs prefix_delegation")
+        return values
+
+
+class ClusterAutoscalerConfig(BaseModel):
+    # durations use the go format of the cluster-autoscaler flags, e.g. 10s, 5m
+    scan_interval: str = "10s"
+    new_pod_scale_up_delay: str = "0s"
+    scale_down_delay_after_add: str = "10m"
+    scale_down_unneeded_time: str = "10m"
+    scale_down_utilization_threshold: float = 0.5
+    max_node_provision_time: str = "15m"
+    expander: str = "least-waste"
+    # priority expander: priority -> node group id_surfix list, higher wins
+    priorities: Dict[int, List[str]] = {}
+
+    @validator(
+        "scan_interval",
+        "new_pod_scale_up_delay",
+        "scale_down_delay_after_add",
+        "scale_down_unneeded_time",
+        "max_node_provision_time",
+    )
+    def check_duration(cls, v: str) -> str:
+        if not re.fullmatch(r"\d+(s|m|h)", v):
+            raise ValueError(f"duration must look like 10s, 5m or 1h, got {v}")
+        return v
+
+    @validator("scale_down_utilization_threshold")
+    def check_utilization_threshold(cls, v: float) -> float:
+        if not 0 < v <= 1:
+            raise ValueError(
+                f"scale_down_utilization_threshold must be in (0, 1], got {v}"
+            )
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def check_expander(cls, values: Dict) -> Dict:
+        expander = values["expander"]
+        if expander not in [
+            "least-waste",
+            "most-pods",
+            "priority",
+            "random",
+        ]:
+            raise ValueError(f"unsupported expander {expander}")
+        if expander == "priority" and not values["priorities"]:
+            raise ValueError("priority expander needs priorities")
+        return values
+
+
+class OverprovisioningPool(BaseModel):
+    # placeholder pods kept on the node group, preempted by real workloads
+    replicas: int = 1
+    # replicas between business_hours_start and business_hours_end
+    business_hours_replicas: Optional[int] = None
+    cpu: str
+    memory: str
+
+
+class OverprovisioningConfig(BaseModel):
+    # cron schedules in UTC, kube-controller-manager of EKS runs in UTC
+    business_hours_start: str = "0 7 * * 1-5"
+    business_hours_end: str = "0 19 * * 1-5"
+    # node group id_surfix -> placeholder pods
+    pools: Dict[str, OverprovisioningPool] = {}
+
+
+class EksFargateProfile(BaseModel):
+    id_surfix: str
+    # helm job_scheduling entry the backend uses to launch pods on the profile
+    workload: str
+    # workload whose jobs overflow to the profile when its node group is full
+    overflow_of: Optional[str] = None
+    # pods in the namespace with all of the labels run on Fargate
+    namespace: str
+    labels: Dict[str, str] = {}
+
+
 class EksClusterCfg(BaseModel):
     whitelist_ips: List[WhitelistIP]
     node_group: List[EksNodeGroup]
+    vpc_cni: VpcCniConfig = VpcCniConfig()
+    cluster_autoscaler: ClusterAutoscalerConfig = ClusterAutoscalerConfig()
+    overprovisioning: OverprovisioningConfig = OverprovisioningConfig()
+    # workload -> node group id_surfixes, rendered into helm scheduling values.
+    # Several node groups (e.g. an amd64 and an arm64 pool) are selected by
+    # node affinity on their label, the architectures of the image pick one
+    workload_placement: Dict[str, List[str]] = {}
+    fargate_profiles: List[EksFargateProfile] = []
+    # cloudwatch logs of the Fargate pods
+    fargate_log_retention_days: int = 14
+
+    @root_validator(skip_on_failure=True)
+    def check_autoscaler_priorities(cls, values: Dict) -> Dict:
+        node_group_ids = {
+            node_group.id_surfix for node_group in values["node_group"]
+        }
+        for id_surfixes in values["cluster_autoscaler"].priorities.values():
+            unknown = set(id_surfixes) - node_group_ids
+            if unknown:
+                raise ValueError(
+                    f"autoscaler priorities refer to unknown node groups {sorted(unknown)}"
+                )
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def check_overprovisioning_pools(cls, values: Dict) -> Dict:
+        node_group_ids = {
+            node_group.id_surfix for node_group in values["node_group"]
+        }
+        unknown = set(values["overprovisioning"].pools) - node_group_ids
+        if unknown:
+            raise ValueError(
+                f"overprovisioning refers to unknown node groups {sorted(unknown)}"
+            )
+        return values
+
+    @validator("workload_placement", pre=True)
+    def split_workload_placement(cls, v: Dict) -> Dict:
+        # a single node group may be given without a list
+        return {
+            workload: [id_surfixes] if isinstance(id_surfixes, str) else id_surfixes
+            for workload, id_surfixes in v.items()
+        }
+
+    @root_validator(skip_on_failure=True)
+    def check_workload_placement(cls, values: Dict) -> Dict:
+        node_groups = {
+            node_group.id_surfix: node_group for node_group in values["node_group"]
+        }
+        for workload, id_surfixes in values["workload_placement"].items():
+            if not id_surfixes:
+                raise ValueError(f"workload {workload} is placed on no node group")
+            unknown = set(id_surfixes) - set(node_groups)
+            if unknown:
+                raise ValueError(
+                    f"workload_placement refers to unknown node groups {sorted(unknown)}"
+                )
+            # the node affinity matches the values of the same label keys
+            label_keys = {
+                tuple(sorted(node_groups[id_surfix].label))
+                for id_surfix in id_surfixes
+            }
+            if len(label_keys) > 1:
+                raise ValueError(
+                    f"node groups {id_surfixes} of workload {workload} don't share their label keys"
+                )
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def check_node_tuning(cls, values: Dict) -> Dict:
+        # one node-tuning daemon set per node label, so node groups sharing a
+        # label must be tuned the same way
+        node_tuning_by_label: Dict[str, EksNodeGroup] = {}
+        for node_group in values["node_group"]:
+            label_key = json.dumps(node_group.label, sort_keys=True)
+            other = node_tuning_by_label.setdefault(label_key, node_group)
+            if other.node_tuning != node_group.node_tuning:
+                raise ValueError(
+                    f"node groups {other.id_surfix} and {node_group.id_surfix} share the label {node_group.label} but not the node tuning"
+                )
+        return values
+
+    @validator("fargate_log_retention_days")
+    def check_fargate_log_retention_days(cls, v: int) -> int:
+        # the values cloudwatch logs accepts
+        if v not in [1, 3, 5, 7, 14, 30, 60, 90, 120, 150, 180, 365]:
+            raise ValueError(f"unsupported log retention of {v} days")
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def check_fargate_profiles(cls, values: Dict) -> Dict:
+        for profile in values["fargate_profiles"]:
+            if profile.workload in values["workload_placement"]:
+                raise ValueError(
+                    f"workload {profile.workload} is placed on a node group and on Fargate"
+                )
+            if (
+                profile.overflow_of is not None
+                and profile.overflow_of not in values["workload_placement"]
+            ):
+                raise ValueError(
+                    f"fargate profile {profile.id_surfix} overflows unknown workload {profile.overflow_of}"
+                )
+        return values
+
+
+def _normalize_db_instance_type(instance_type: str) -> str:
+    instance_type = (
+        instance_type[len("db.") :]
+        if instance_type.startswith("db.")
+        else instance_type
+    )
+    if not re.fullmatch(r"[a-z][a-z0-9-]*\.[a-z0-9]+", instance_type):
+        raise ValueError(f"invalid db instance_type {instance_type}")
+    return instance_type
+
+
+class DbReadReplica(BaseModel):
+    # the one of the writer without
+    instance_type: Optional[str] = None
+    # any availability zone of the isolated subnets without
+    availability_zone: Optional[str] = None
+
+    @validator("instance_type")
+    def check_instance_type(cls, v: Optional[str]) -> Optional[str]:
+        return None if v is None else _normalize_db_instance_type(v)
+
+
+class DbProxyCfg(BaseModel):
+    # IAM authentication of the clients instead of the password of the secret,
+    # the client roles need rds-db:connect on the proxy
+    iam_auth: bool = False
+    require_tls: bool = False
+    # of max_connections of the database
+    max_connections_percent: int = 90
+    max_idle_connections_percent: int = 50
+    # closes client connections idle for longer
+    idle_client_timeout_minutes: int = 30
+    # waits up to it for a free database connection before an error
+    connection_borrow_timeout_seconds: int = 120
+
+    @root_validator(skip_on_failure=True)
+    def check_connections_percent(cls, values: Dict) -> Dict:
+        max_connections = values["max_connections_percent"]
+        if not 1 <= max_connections <= 100:
+            raise ValueError("max_connections_percent must be between 1 and 100")
+        if not 0 <= values["max_idle_connections_percent"] <= max_connections:
+            raise ValueError(
+                "max_idle_connections_percent must be between 0 and max_connections_percent"
+            )
+        return values
+
+
+class DbCfg(BaseModel):
+    # postgres version, e.g. "13.4", major version is the first part
+    engine_version: str = "12.2"
+    # with or without the db. prefix, e.g. m6g.large
+    instance_type: str = "t2.micro"
+    storage_type: str = "gp2"
+    allocated_storage_gb: int = 10
+    # storage autoscaling up to it, disabled without
+    max_allocated_storage_gb: Optional[int] = None
+    # only for gp3 (iops and throughput) and io1 (iops)
+    iops: Optional[int] = None
+    throughput_mibps: Optional[int] = None
+    multi_az: bool = False
+    # published as the reader endpoint, the writer without replicas
+    read_replicas: List[DbReadReplica] = []
+    # RDS Proxy in front of the writer, published as ssm-api-db-proxy-dns
+    proxy: Optional[DbProxyCfg] = None
+    # parameter group overrides of DB_BASE_PARAMETERS of aws/db_stack.py,
+    # static parameters, e.g. shared_preload_libraries, need a reboot
+    parameters: Dict[str, str] = {}
+    performance_insights: bool = False
+    # DEFAULT (7 days) or LONG_TERM (2 years)
+    performance_insights_retention: str = "DEFAULT"
+    # enhanced monitoring granularity, 0 disables it
+    monitoring_interval_seconds: int = 60
+
+    @validator("engine_version")
+    def check_engine_version(cls, v: str) -> str:
+        if not re.fullmatch(r"\d+\.\d+", v):
+            raise ValueError(
+                f"engine_version must be a full postgres version, e.g. 13.4, got {v}"
+            )
+        return v
+
+    @validator("instance_type")
+    def check_instance_type(cls, v: str) -> str:
+        return _normalize_db_instance_type(v)
+
+    @validator("storage_type")
+    def check_storage_type(cls, v: str) -> str:
+        if v not in ["gp2", "gp3", "io1"]:
+            raise ValueError(f"storage_type must be gp2, gp3 or io1, got {v}")
+        return v
+
+    @validator("performance_insights_retention")
+    def check_performance_insights_retention(cls, v: str) -> str:
+        if v not in ["DEFAULT", "LONG_TERM"]:
+            raise ValueError(
+                f"performance_insights_retention must be DEFAULT or LONG_TERM, got {v}"
+            )
+        return v
+
+    @validator("monitoring_interval_seconds")
+    def check_monitoring_interval_seconds(cls, v: int) -> int:
+        if v not in [0, 1, 5, 10, 15, 30, 60]:
+            raise ValueError(
+                f"monitoring_interval_seconds must be 0, 1, 5, 10, 15, 30 or 60, got {v}"
+            )
+        return v
+
+    @validator("parameters", pre=True)
+    def check_parameters(cls, v: Dict) -> Dict[str, str]:
+        # yaml numbers and booleans, parameter values are strings
+        return {
+            name: str(int(value) if isinstance(value, bool) else value)
+            for name, value in v.items()
+        }
+
+    @property
+    def engine_major_version(self) -> str:
+        return self.engine_version.split(".")[0]
+
+    @root_validator(skip_on_failure=True)
+    def check_storage(cls, values: Dict) -> Dict:
+        storage_type = values["storage_type"]
+        allocated = values["allocated_storage_gb"]
+        max_allocated = values.get("max_allocated_storage_gb")
+        iops = values.get("iops")
+        throughput = values.get("throughput_mibps")
+        if max_allocated is not None and max_allocated <= allocated:
+            raise ValueError(
+                "max_allocated_storage_gb must be greater than allocated_storage_gb"
+            )
+        if throughput is not None and storage_type != "gp3":
+            raise ValueError("throughput_mibps can only be set for gp3 storage")
+        if iops is not None and storage_type == "gp2":
+            raise ValueError("iops can not be set for gp2 storage")
+        if iops is None and storage_type == "io1":
+            raise ValueError("io1 storage needs iops")
+        if storage_type == "gp3" and (iops is not None or throughput is not None):
+            # below 400 GB, postgres gp3 has a fixed 3000 IOPS and 125 MiBps
+            if allocated < 400:
+                raise ValueError(
+                    "gp3 iops and throughput_mibps need allocated_storage_gb of at least 400"
+                )
+            if iops is None or throughput is None:
+                raise ValueError("gp3 storage needs both iops and throughput_mibps")
+            if not 12000 <= iops <= 64000:
+                raise ValueError("gp3 iops must be between 12000 and 64000")
+            if not 500 <= throughput <= 4000:
+                raise ValueError("gp3 throughput_mibps must be between 500 and 4000")
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def check_performance_insights(cls, values: Dict) -> Dict:
+        instance_family, instance_size = values["instance_type"].split(".")
+        if (
+            values["performance_insights"]
+            and instance_family.startswith("t")
+            and instance_size in ["micro", "small"]
+        ):
+            raise ValueError(
+                f"performance insights is not supported on {values['instance_type']}"
+            )
+        return values
+
+
+class CacheTierCfg(BaseModel):
+    node_type: str = "cache.t3.small"
+    # redis version, the parameter group family is redis<major>.x
+    engine_version: str = "6.2"
+    # replicas of each shard, automatic failover and multi-AZ need one
+    replicas: int = 1
+    # sharded cluster mode, clients need cluster support
+    cluster_mode: bool = False
+    num_shards: int = 1
+    # parameter group overrides of CACHE_BASE_PARAMETERS of aws/cache_stack.py
+    parameters: Dict[str, str] = {}
+    # days of daily snapshots, 0 disables them (no persistence)
+    snapshot_retention_days: int = 0
+    # UTC, e.g. 03:00-04:00
+    snapshot_window: Optional[str] = None
+
+    @validator("node_type")
+    def check_node_type(cls, v: str) -> str:
+        if not re.fullmatch(r"cache\.[a-z][a-z0-9-]*\.[a-z0-9]+", v):
+            raise ValueError(f"invalid cache node_type {v}, e.g. cache.m6g.large")
+        return v
+
+    @validator("engine_version")
+    def check_engine_version(cls, v: str) -> str:
+        if not re.fullmatch(r"[6-9]\.\d+", v):
+            raise ValueError(f"engine_version must be a redis 6 or later version, got {v}")
+        return v
+
+    @validator("replicas")
+    def check_replicas(cls, v: int) -> int:
+        if not 0 <= v <= 5:
+            raise ValueError("replicas must be between 0 and 5")
+        return v
+
+    @validator("parameters", pre=True)
+    def check_parameters(cls, v: Dict) -> Dict[str, str]:
+        return {name: str(value) for name, value in v.items()}
+
+    @validator("snapshot_retention_days")
+    def check_snapshot_retention_days(cls, v: int) -> int:
+        if not 0 <= v <= 35:
+            raise ValueError("snapshot_retention_days must be between 0 and 35")
+        return v
+
+    @validator("snapshot_window")
+    def check_snapshot_window(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and not re.fullmatch(r"\d{2}:\d{2}-\d{2}:\d{2}", v):
+            raise ValueError(f"snapshot_window must be like 03:00-04:00, got {v}")
+        return v
+
+    @property
+    def parameter_group_family(self) -> str:
+        return f"redis{self.engine_version.split('.')[0]}.x"
+
+    @root_validator(skip_on_failure=True)
+    def check_shards(cls, values: Dict) -> Dict:
+        if not values["cluster_mode"] and values["num_shards"] != 1:
+            raise ValueError("num_shards needs cluster_mode")
+        if values["cluster_mode"] and values["replicas"] < 1:
+            raise ValueError("cluster_mode needs at least one replica per shard")
+        return values
+
+
+class CacheCfg(BaseModel):
+    # tier name -> redis replication group, e.g. separate tiers for the
+    # realtime queue, the batch queue and the app cache, so they don't share
+    # memory and eviction. Published as ssm-redis-<tier>-*-endpoint
+    tiers: Dict[str, CacheTierCfg]
+
+    @validator("tiers")
+    def check_tiers(cls, v: Dict[str, CacheTierCfg]) -> Dict[str, CacheTierCfg]:
+        if not v:
+            raise ValueError("at least one cache tier is required")
+        for name in v:
+            if not re.fullmatch(r"[a-z][a-z0-9]*", name):
+                raise ValueError(
+                    f"cache tier name must be lowercase alphanumeric, got {name}"
+                )
+        return v
+
+
+class S3EventFilter(BaseModel):
+    prefix: Optional[str] = None
+    suffix: Optional[str] = None
+
+
+class DataEventsCfg(BaseModel):
+    # object created events of the data bucket matching any of the filters
+    # go to the data-events queue
+    filters: List[S3EventFilter]
+    # longer than the handling of an event by the consumers
+    visibility_timeout_seconds: int = 300
+    # receives of an event before it goes to the dead letter queue
+    max_receive_count: int = 5
+    retention_days: int = 4
+
+    @validator("filters")
+    def check_filters(cls, v: List[S3EventFilter]) -> List[S3EventFilter]:
+        if not v:
+            raise ValueError("at least one data event filter is required")
+        return v
+
+    @validator("visibility_timeout_seconds")
+    def check_visibility_timeout_seconds(cls, v: int) -> int:
+        if not 0 <= v <= 43200:
+            raise ValueError("visibility_timeout_seconds must be between 0 and 43200")
+        return v
+
+    @validator("retention_days")
+    def check_retention_days(cls, v: int) -> int:
+        if not 1 <= v <= 14:
+            raise ValueError("retention_days must be between 1 and 14")
+        return v
+
+
+class BatchJobDef(BaseModel):
+    vcpus: int = 4
+    memory_mib: int = 14000
+    # per attempt, the job is killed after it
+    timeout_minutes: int = 240
+    # attempts of a job, spot interruptions are retried
+    retry_attempts: int = 3
+
+    @validator("retry_attempts")
+    def check_retry_attempts(cls, v: int) -> int:
+        if not 1 <= v <= 10:
+            raise ValueError("retry_attempts must be between 1 and 10")
+        return v
+
+
+class BatchCfg(BaseModel):
+    # instance types of the spot compute environment
+    instance_types: List[str]
+    min_vcpus: int = 0
+    max_vcpus: int
+    # job queue name -> priority, higher is scheduled first
+    queues: Dict[str, int]
+    job: BatchJobDef = BatchJobDef()
+    # shards of a match request running at the same time
+    shard_max_concurrency: int = 10
+    image_tag: str = "latest"
+
+    @validator("queues")
+    def check_queues(cls, v: Dict[str, int]) -> Dict[str, int]:
+        if not v:
+            raise ValueError("at least one batch job queue is required")
+        for name, priority in v.items():
+            if not 0 <= priority <= 1000:
+                raise ValueError(
+                    f"priority of batch job queue {name} must be between 0 and 1000"
+                )
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def check_vcpus(cls, values: Dict) -> Dict:
+        if values["min_vcpus"] > values["max_vcpus"]:
+            raise ValueError("min_vcpus must not be greater than max_vcpus")
+        if values["job"].vcpus > values["max_vcpus"]:
+            raise ValueError("batch job vcpus must not be greater than max_vcpus")
+        return values
+
+
+class CdnSiteCfg(BaseModel):
+    # <hostname_prefix>.<domain> is served by the distribution, the ingress of
+    # the component moves to origin-<hostname_prefix>.<domain>
+    hostname_prefix: str
+    # path patterns of the fingerprinted assets, cached for static_ttl_days
+    static_paths: List[str] = []
+    static_ttl_days: int = 365
+    # everything else, e.g. index.html, which references the current assets
+    default_ttl_seconds: int = 60
+    max_ttl_seconds: int = 300
+
+    @validator("static_paths")
+    def check_static_paths(cls, v: List[str]) -> List[str]:
+        for path in v:
+            if path in ("", "*", "/*"):
+                raise ValueError(
+                    f"static path {path!r} would cache the whole site for long"
+                )
+        return v
+
+    @property
+    def origin_hostname_prefix(self) -> str:
+        """hostname prefix of the ingress behind the distribution of the site"""
+        return f"origin-{self.hostname_prefix}"
+
+    @root_validator(skip_on_failure=True)
+    def check_ttl(cls, values: Dict) -> Dict:
+        if not 0 <= values["default_ttl_seconds"] <= values["max_ttl_seconds"]:
+            raise ValueError(
+                "default_ttl_seconds must be between 0 and max_ttl_seconds"
+            )
+        if values["static_ttl_days"] < 1:
+            raise ValueError("static_ttl_days must be at least 1")
+        return values
+
+
+class CdnCfg(BaseModel):
+    # chart component of the uniframe chart -> site, e.g. frontend and doc
+    sites: Dict[str, CdnSiteCfg]
+    # PRICE_CLASS_100 | PRICE_CLASS_200 | PRICE_CLASS_ALL
+    price_class: str = "PRICE_CLASS_100"
+    # the region of the extra caching layer in front of the ALB, e.g. the
+    # region of the cluster. No origin shield without
+    origin_shield_region: Optional[str] = None
+    http3: bool = True
+
+    @validator("sites")
+    def check_sites(cls, v: Dict[str, CdnSiteCfg]) -> Dict[str, CdnSiteCfg]:
+        if not v:
+            raise ValueError("at least one cdn site is required")
+        return v
+
+    @validator("price_class")
+    def check_price_class(cls, v: str) -> str:
+        if v not in ("PRICE_CLASS_100", "PRICE_CLASS_200", "PRICE_CLASS_ALL"):
+            raise ValueError(f"unknown cloudfront price_class {v}")
+        return v
 
 
 class EnvDepProperties(BaseModel):
@@ -66,6 +955,12 @@ class EnvDepProperties(BaseModel):
     ebs_storage: EbsStorage
     eks_host_zone: EksHostZone
     eks_cluster_cfg: EksClusterCfg
+    db: DbCfg = DbCfg()
+    cache: CacheCfg
+    data_events: DataEventsCfg
+    batch: BatchCfg
+    # CloudFront in front of the frontend and doc, no CdnStack without
+    cdn: Optional[CdnCfg] = None
     backend_task_def: FargateTaskDef
     frontend_task_def: FargateTaskDef
     doc_task_def: FargateTaskDef
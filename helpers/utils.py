@@ -41,3 +41,79 @@ def get_aws_load_balancer_controller_repo(region_name: str) -> str:
     image_account_id = alb_image_mapping[region_name]
 
     return f"{image_account_id}.dkr.ecr.{region_name}.amazonaws.com/amazon/aws-load-balancer-controller"
+
+
+# (max ENIs, IPv4 addresses per ENI, vCPUs) of the instance types we run EKS nodes on
+# https://github.com/awslabs/amazon-eks-ami/blob/master/files/eni-max-pods.txt
+EC2_ENI_LIMITS = {
+    "t3.small": (3, 4, 2),
+    "t3.medium": (3, 6, 2),
+    "t3.large": (3, 12, 2),
+    "t3.xlarge": (4, 15, 4),
+    "t3.2xlarge": (4, 15, 8),
+    "t3a.small": (2, 4, 2),
+    "t3a.medium": (3, 6, 2),
+    "t3a.large": (3, 12, 2),
+    "t3a.xlarge": (4, 15, 4),
+    "t3a.2xlarge": (4, 15, 8),
+    "c5.large": (3, 10, 2),
+    "c5.xlarge": (4, 15, 4),
+    "c5.2xlarge": (4, 15, 8),
+    "c5a.large": (3, 10, 2),
+    "c5a.xlarge": (4, 15, 4),
+    "c5a.2xlarge": (4, 15, 8),
+    "c6i.large": (3, 10, 2),
+    "c6i.xlarge": (4, 15, 4),
+    "c6i.2xlarge": (4, 15, 8),
+    "m5.large": (3, 10, 2),
+    "m5.xlarge": (4, 15, 4),
+    "m5.2xlarge": (4, 15, 8),
+    "m5a.large": (3, 10, 2),
+    "m5a.xlarge": (4, 15, 4),
+    "m5a.2xlarge": (4, 15, 8),
+    "m6i.large": (3, 10, 2),
+    "m6i.xlarge": (4, 15, 4),
+    "m6i.2xlarge": (4, 15, 8),
+    "r5.large": (3, 10, 2),
+    "r5.xlarge": (4, 15, 4),
+    # Graviton2 (arm64)
+    "t4g.medium": (3, 6, 2),
+    "t4g.large": (3, 12, 2),
+    "t4g.xlarge": (4, 15, 4),
+    "c6g.large": (3, 10, 2),
+    "c6g.xlarge": (4, 15, 4),
+    "c6g.2xlarge": (4, 15, 8),
+    "m6g.large": (3, 10, 2),
+    "m6g.xlarge": (4, 15, 4),
+    "m6g.2xlarge": (4, 15, 8),
+    "r6g.large": (3, 10, 2),
+    "r6g.xlarge": (4, 15, 4),
+}
+
+# instance families the EKS arm64 AMIs run on, aws-eks of our CDK version
+# derives the node group AMI type from the same list
+EC2_ARM64_FAMILIES = ["a1", "c6g", "c6gd", "c6gn", "m6g", "m6gd", "r6g", "r6gd", "t4g"]
+
+
+def get_eks_max_pods(instance_type: str, prefix_delegation: bool) -> int:
+    """
+    Same calculation as the EKS max-pods-calculator.sh: every ENI but the
+    primary IP hosts pods, a /28 prefix counts as 16 IPs, plus 2 host network
+    pods (aws-node, kube-proxy). EKS recommends 110 pods at most below 30 vCPUs.
+    """
+    try:
+        max_enis, ips_per_eni, vcpus = EC2_ENI_LIMITS[instance_type]
+    except KeyError:
+        raise ValueError(
+            f"Unknown ENI limits for {instance_type}, please add it to EC2_ENI_LIMITS"
+        )
+
+    ips_per_slot = 16 if prefix_delegation else 1
+    max_pods = max_enis * (ips_per_eni - 1) * ips_per_slot + 2
+    return min(max_pods, 110 if vcpus < 30 else 250)
+
+
+def get_ec2_arch(instance_type: str) -> str:
+    """Kubernetes architecture (kubernetes.io/arch) of an instance type"""
+    family = instance_type.split(".")[0]
+    return "arm64" if family in EC2_ARM64_FAMILIES else "amd64"
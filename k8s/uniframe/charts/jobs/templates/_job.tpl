@@ -0,0 +1,75 @@
+{{/*
+Pod template of a job of a size class.
+Takes a dict of the root context (root), the size class name (class) and
+the container args (args, optional, set by the backend otherwise) and the
+priority class (priority_class, optional, the one of the size class otherwise).
+*/}}
+{{- define "jobs.pod_template" -}}
+{{- $class := index .root.Values.size_classes .class -}}
+metadata:
+  labels:
+    app: matching-job
+    size-class: {{ .class }}
+spec:
+  {{- with (.priority_class | default $class.priority_class) }}
+  priorityClassName: {{ $.root.Release.Name }}-{{ . }}
+  {{- end }}
+  restartPolicy: Never
+  containers:
+    - name: job
+      image: {{ .root.Values.global.aws_account }}.dkr.ecr.{{ .root.Values.global.aws_default_region }}.amazonaws.com/{{ .root.Values.global.app_name }}-{{ .root.Values.global.deploy_dev }}-backend:{{ .root.Values.image.tag }}
+      imagePullPolicy: {{ .root.Values.image.imagePullPolicy }}
+      {{- with .args }}
+      args:
+        {{- toYaml . | nindent 8 }}
+      {{- end }}
+      resources:
+        requests:
+          cpu: {{ $class.resources.requests.cpu }}
+          memory: {{ $class.resources.requests.memory }}
+        limits:
+          {{- toYaml $class.resources.limits | nindent 10 }}
+      env:
+        - name: AWS_DEFAULT_REGION
+          value: {{ .root.Values.global.aws_default_region }}
+        - name: API_RUN_LOCATION
+          value: k8s
+        - name: DOMAIN_NAME
+          value: {{ .root.Values.global.ingress.hostname }}
+        - name: K8S_JOB_SIZE_CLASS
+          value: {{ .class }}
+  {{- $scheduling := $class.scheduling | default dict }}
+  {{- with $scheduling.node_selector }}
+  nodeSelector:
+    {{- toYaml . | nindent 4 }}
+  {{- end }}
+  {{- with $scheduling.tolerations }}
+  tolerations:
+    {{- toYaml . | nindent 4 }}
+  {{- end }}
+  affinity:
+    # only nodes of the architectures the image is built for
+    nodeAffinity:
+      requiredDuringSchedulingIgnoredDuringExecution:
+        nodeSelectorTerms:
+          - matchExpressions:
+              - key: kubernetes.io/arch
+                operator: In
+                values:
+                  {{- toYaml .root.Values.architectures | nindent 18 }}
+              {{- with $scheduling.node_match_expressions }}
+              {{- toYaml . | nindent 14 }}
+              {{- end }}
+{{- end }}
+
+{{/*
+Job spec of a size class, same arguments as jobs.pod_template.
+*/}}
+{{- define "jobs.job_spec" -}}
+{{- $class := index .root.Values.size_classes .class -}}
+activeDeadlineSeconds: {{ $class.active_deadline_seconds }}
+ttlSecondsAfterFinished: {{ $class.ttl_seconds_after_finished }}
+backoffLimit: {{ $class.backoff_limit }}
+template:
+  {{- include "jobs.pod_template" . | nindent 2 }}
+{{- end }}
@@ -1,6 +1,7 @@
 # This script installs L2 components, including
 # - prometheus
-# - Redis
+# - Redis password secret
+# - KEDA
 # - fluent-bit
 PRODUCT_PREFIX=uniframe
 AWS_REGION=eu-west-1
@@ -30,17 +31,64 @@ done
 EKS_NAME=$(aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-eks-cluster-name --query "Parameters[0].Value" | tr -d '"')
 aws eks update-kubeconfig --name ${EKS_NAME}
 
+# autoscaler tuning and priorities are derived from conf/env_props.${DEPLOY_ENV}.yaml
+install_aws_plugins () {
+  EKS_CLUSTER_AUTO_SCALER_ROLE_ARN=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-eks-cluster-auto-scaler-role-arn --query "Parameters[0].Value" | tr -d '"'`
+  EKS_CLUSTER_NAME=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-eks-cluster-name --query "Parameters[0].Value" | tr -d '"'`
+
+  echo EKS_CLUSTER_NAME is ${EKS_CLUSTER_NAME}
+  echo EKS_CLUSTER_AUTO_SCALER_ROLE_ARN is ${EKS_CLUSTER_AUTO_SCALER_ROLE_ARN}
+
+  AWS_PLUGINS_ENV_VALUES=$(mktemp)
+  python -m helpers.output_helm_values ${DEPLOY_ENV} aws-plugins > ${AWS_PLUGINS_ENV_VALUES} || exit 1
+
+  #helm upgrade --install ${PRODUCT_PREFIX}-${DEPLOY_ENV}-aws-plugins k8s/aws-plugins -f k8s/aws-plugins/values.yaml \
+  helm upgrade --install aws-plugins k8s/aws-plugins -f k8s/aws-plugins/values.yaml \
+    -f ${AWS_PLUGINS_ENV_VALUES} \
+    --set global.aws_default_region=${AWS_REGION} \
+    --set autoscaler.aws_role_arn=${EKS_CLUSTER_AUTO_SCALER_ROLE_ARN} \
+    --set autoscaler.eks_cluster_name=${EKS_CLUSTER_NAME}
+}
+
+# install aws plugins first: nodes with node tuning stay tainted until its
+# node-tuning daemon set has tuned them, the pods of the other charts placed
+# on them (e.g. the admission webhook job of prometheus) wait for it
+echo "[aws-plugins] starting to install"
+install_aws_plugins
+
 GRAFANA_PASSWORD=$(aws secretsmanager get-secret-value --secret-id ${PRODUCT_PREFIX}-${DEPLOY_ENV}-grafana-admin-secret --region ${AWS_REGION} --query SecretString --output text)
 # install prometheus
 # TODO: deploy prometheus into monitoring namespace
 echo "[prometheus-suite] starting to install"
 helm repo add prometheus-community https://prometheus-community.github.io/helm-charts
 helm repo update
+PROMETHEUS_ENV_VALUES=$(mktemp)
+python -m helpers.output_helm_values ${DEPLOY_ENV} prometheus > ${PROMETHEUS_ENV_VALUES} || exit 1
 helm upgrade --install prometheus prometheus-community/kube-prometheus-stack -f k8s/l2-configuration/prometheus_values.yaml \
-    --set prometheus.prometheusSpec.nodeSelector.node-pool=main\
+    -f ${PROMETHEUS_ENV_VALUES} \
     --set prometheus.prometheusSpec.additionalScrapeConfigs[0].relabel_configs[1].replacement="${PRODUCT_PREFIX}-${DEPLOY_ENV}-backend-service.nm.svc:8000"\
     --set grafana.adminPassword="${GRAFANA_PASSWORD}"
 
+# upgrade aws plugins once the CRDs of kube-prometheus-stack exist, the
+# PrometheusRule of the overprovisioning headroom is only rendered then
+echo "[aws-plugins] rendering the prometheus rules"
+install_aws_plugins
+
+# install prometheus-adapter, it serves the metrics of the uniframe HPAs
+echo "[prometheus-adapter] starting to install"
+helm upgrade --install prometheus-adapter prometheus-community/prometheus-adapter \
+    -f k8s/l2-configuration/prometheus_adapter_values.yaml
+
+# install KEDA, it scales the uniframe rq workers on the length of their queues.
+# KEDA 2.9+ needs kubernetes 1.23 (autoscaling/v2), chart 2.8.2 is KEDA 2.8.1
+echo "[keda] starting to install"
+helm repo add kedacore https://kedacore.github.io/charts
+helm repo update
+helm upgrade --install keda kedacore/keda -n keda\
+    --version 2.8.2\
+    --create-namespace\
+    --set nodeSelector.node-pool=main
+
 # # install fluent-bit
 # helm repo add eks https://aws.github.io/eks-charts
 # helm upgrade --install aws-for-fluent-bit --namespace logging eks/aws-for-fluent-bit\
@@ -84,11 +132,14 @@ helm upgrade --install external-dns bitnami/external-dns\
     --set domainFilters[1]="api.${DOMAIN_NAME}"\
     --set domainFilters[2]="www.${DOMAIN_NAME}"\
     --set domainFilters[3]="doc.${DOMAIN_NAME}"\
+    --set domainFilters[4]="origin-www.${DOMAIN_NAME}"\
+    --set domainFilters[5]="origin-doc.${DOMAIN_NAME}"\
     --set policy=sync\
     --set nodeSelector.node-pool=main
 
 
-# install redis
+# redis is the ElastiCache replication group of the CacheStack, the password
+# is its auth token. KEDA reads it from this secret to scale the rq workers
 REDIS_PASSWORD=$(aws secretsmanager get-secret-value --secret-id ${PRODUCT_PREFIX}-${DEPLOY_ENV}-redis-secret --region ${AWS_REGION} --query SecretString --output text)
 
 if [ -z "${REDIS_PASSWORD}" ]; then
@@ -96,14 +147,11 @@ if [ -z "${REDIS_PASSWORD}" ]; then
     exit 1
 fi
 
-echo "[redis] starting to install"
-helm repo add bitnami https://charts.bitnami.com/bitnami
-helm upgrade --install redis bitnami/redis -n ${NAMESPACE}\
-    --create-namespace\
-    --set replica.replicaCount=1\
-    --set auth.password=${REDIS_PASSWORD}\
-    --set master.nodeSelector.node-pool=main\
-    --set replica.nodeSelector.node-pool=main
+echo "[redis-secret] starting to create"
+kubectl create namespace ${NAMESPACE} --dry-run=client -o yaml | kubectl apply -f -
+kubectl create secret generic redis -n ${NAMESPACE}\
+    --from-literal=redis-password=${REDIS_PASSWORD}\
+    --dry-run=client -o yaml | kubectl apply -f -
 
 
 # -----------------------
@@ -125,17 +173,3 @@ helm upgrade --install redis bitnami/redis -n ${NAMESPACE}\
 # echo $WHITELIST_IPS
 # echo "wait for 2 minutes"
 # sleep 2m
-
-# install aws plugins
-echo "[aws-plugins] starting to install"
-EKS_CLUSTER_AUTO_SCALER_ROLE_ARN=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-eks-cluster-auto-scaler-role-arn --query "Parameters[0].Value" | tr -d '"'`
-EKS_CLUSTER_NAME=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-eks-cluster-name --query "Parameters[0].Value" | tr -d '"'`
-
-echo EKS_CLUSTER_NAME is ${EKS_CLUSTER_NAME}
-echo EKS_CLUSTER_AUTO_SCALER_ROLE_ARN is ${EKS_CLUSTER_AUTO_SCALER_ROLE_ARN}
-
-#helm upgrade --install ${PRODUCT_PREFIX}-${DEPLOY_ENV}-aws-plugins k8s/aws-plugins -f k8s/aws-plugins/values.yaml \
-helm upgrade --install aws-plugins k8s/aws-plugins -f k8s/aws-plugins/values.yaml \
-  --set global.aws_default_region=${AWS_REGION} \
-  --set autoscaler.aws_role_arn=${EKS_CLUSTER_AUTO_SCALER_ROLE_ARN} \
-  --set autoscaler.eks_cluster_name=${EKS_CLUSTER_NAME}
@@ -26,6 +26,16 @@ DNS_INGRESS_SECURITY_GROUP=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${D
 DNS_INGRESS_ACM_ARN=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-eks-certificate-manager-arn --query "Parameters[0].Value" | tr -d '"'`
 DNS_HOSTNAME=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-eks-domain-name --query "Parameters[0].Value" | tr -d '"'`
 
+# endpoints of the redis tiers of conf/env_props.${DEPLOY_ENV}.yaml
+REDIS_TIERS=$(python -m helpers.output_redis_tiers ${DEPLOY_ENV}) || exit 1
+REDIS_SET_ARGS=""
+for REDIS_TIER in ${REDIS_TIERS}; do
+  REDIS_HOST=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-redis-${REDIS_TIER}-primary-endpoint --query "Parameters[0].Value" | tr -d '"'`
+  REDIS_READER_HOST=`aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-redis-${REDIS_TIER}-reader-endpoint --query "Parameters[0].Value" | tr -d '"'`
+  echo redis ${REDIS_TIER} tier is ${REDIS_HOST}
+  REDIS_SET_ARGS="${REDIS_SET_ARGS} --set global.redis.tiers.${REDIS_TIER}.host=${REDIS_HOST} --set global.redis.tiers.${REDIS_TIER}.reader_host=${REDIS_READER_HOST}"
+done
+
 
 echo DNS_INGRESS_SECURITY_GROUP is ${DNS_INGRESS_SECURITY_GROUP}
 # extra \ for escape comma
@@ -39,9 +49,15 @@ aws eks update-kubeconfig --name ${EKS_NAME}
 ACCOUNT_ID=$(aws sts get-caller-identity --query Account --output text) 
 
 
+# scheduling of every component is derived from conf/env_props.${DEPLOY_ENV}.yaml
+UNIFRAME_ENV_VALUES=$(mktemp)
+python -m helpers.output_helm_values ${DEPLOY_ENV} uniframe > ${UNIFRAME_ENV_VALUES} || exit 1
+
 # helm install --dry-run --debug ${PRODUCT_PREFIX}-${DEPLOY_ENV} k8s/uniframe  --namespace ${NAMESPACE}  \
 helm upgrade --install  ${PRODUCT_PREFIX}-${DEPLOY_ENV} k8s/uniframe  --namespace ${NAMESPACE}  \
   --create-namespace\
+  -f k8s/uniframe/values.${DEPLOY_ENV}.yaml \
+  -f ${UNIFRAME_ENV_VALUES} \
   --set global.ingress.sg=${DNS_INGRESS_SECURITY_GROUP} \
   --set global.ingress.acm_arn="${DNS_INGRESS_ACM_ARN/,/\,}" \
   --set global.ingress.hostname=${DNS_HOSTNAME}\
@@ -49,4 +65,5 @@ helm upgrade --install  ${PRODUCT_PREFIX}-${DEPLOY_ENV} k8s/uniframe  --namespac
   --set global.namespace=${NAMESPACE}\
   --set global.aws_default_region=${AWS_REGION}\
   --set global.app_name=${PRODUCT_PREFIX}\
-  --set global.deploy_dev=${DEPLOY_ENV}
+  --set global.deploy_dev=${DEPLOY_ENV}\
+  ${REDIS_SET_ARGS}
@@ -1,6 +1,6 @@
 # This script uninstall L2 components, including
 # - prometheus
-# - Redis
+# - Redis password secret
 # - fluent-bit
 PRODUCT_PREFIX=uniframe
 REGION=eu-west-1
@@ -30,8 +30,8 @@ done
 EKS_NAME=$(aws ssm get-parameters --names ${PRODUCT_PREFIX}-${DEPLOY_ENV}-ssm-eks-cluster-name --query "Parameters[0].Value" | tr -d '"')
 aws eks update-kubeconfig --name ${EKS_NAME}
 
-# uninstall redis
-helm uninstall redis -n ${NAMESPACE}
+# delete the redis password secret
+kubectl delete secret redis -n ${NAMESPACE}
 
 # uninstall external DNS
 helm uninstall external-dns